@@ -0,0 +1,295 @@
+"""
+Generates synthetic naeringsspesifikasjon Avro files for benchmarking without production data.
+
+The records have the same layout as the delivered Avro files, a data record with the
+hendelse and naeringsspesifikasjon JSON documents, and the payload follows the schema in
+naeringsspesifikasjon_2023_prod.txt. Every array and sum read by the section registry in
+process_source_data.py is filled, with array lengths and post type frequencies chosen per
+array, sums matching the arrays, and a share of the ids submitted more than once.
+
+    python generate_source_data.py synthetic.avro --records 2000000 --duplicate-rate 0.1
+"""
+import argparse
+import json
+import logging
+import timeit
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import fastavro
+import numpy as np
+import pyarrow as pa
+
+from process_source_data import (
+    ANNEN_DRIFTSINNTEKT,
+    ANNEN_DRIFTSKOSTNAD,
+    BALANSEVERDI_FOR_ANLEGGSMIDDEL,
+    BALANSEVERDI_FOR_OMLOEPSMIDDEL,
+    EGENKAPITAL,
+    FINANSINNTEKT,
+    FINANSKOSTNAD,
+    GJELD_INNEN_BANK_OG_FORSIKRING,
+    KORTSIKTIG_GJELD,
+    LANGSIKTIG_GJELD,
+    LOENNSKOSTNAD,
+    POST_TYPES,
+    SALGSINNTEKT,
+    SECTION_REGISTRY,
+    VAREKOSTNAD,
+    ArrayValues,
+    SumValue,
+    read_naering_arrow_schema,
+    registry_values,
+)
+
+# the layout of the delivered Avro records, the payload is JSON
+AVRO_SCHEMA = {
+    "type": "record",
+    "name": "Naeringsspesifikasjon",
+    "fields": [{
+        "name": "data",
+        "type": {
+            "type": "record",
+            "name": "Data",
+            "fields": [
+                {"name": "hendelse", "type": "string"},
+                {"name": "naeringsspesifikasjon", "type": "string"},
+            ],
+        },
+    }],
+}
+
+NUM_RECORDS = 100_000
+DUPLICATE_RATE = 0.05
+INNTEKTSAAR = "2023"
+SEED = 1175
+
+# per array, the share of submissions where it has elements, the mean number of elements
+# when it has, and the range of RF-1175 post types in it
+ARRAY_PROFILES: dict[ArrayValues, tuple[float, float, tuple[str, str]]] = {
+    SALGSINNTEKT: (0.90, 1.5, ("3000", "3299")),
+    ANNEN_DRIFTSINNTEKT: (0.35, 1.3, ("3300", "3999")),
+    VAREKOSTNAD: (0.50, 1.8, ("4000", "4999")),
+    LOENNSKOSTNAD: (0.40, 2.5, ("5000", "5999")),
+    ANNEN_DRIFTSKOSTNAD: (0.95, 7.0, ("6000", "7999")),
+    FINANSINNTEKT: (0.60, 1.4, ("8000", "8099")),
+    FINANSKOSTNAD: (0.55, 1.4, ("8100", "8199")),
+    BALANSEVERDI_FOR_ANLEGGSMIDDEL: (0.60, 2.5, ("1000", "1399")),
+    BALANSEVERDI_FOR_OMLOEPSMIDDEL: (0.90, 2.5, ("1400", "1999")),
+    EGENKAPITAL: (0.85, 1.5, ("2000", "2099")),
+    LANGSIKTIG_GJELD: (0.55, 1.5, ("2100", "2299")),
+    KORTSIKTIG_GJELD: (0.90, 3.5, ("2300", "2999")),
+    GJELD_INNEN_BANK_OG_FORSIKRING: (0.01, 1.2, ("2100", "2999")),
+}
+
+# sums not of the arrays with the same undertema, given as the undertemaer added and subtracted
+COMBINED_SUMS: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {
+    "aarsresultat": (("driftsinntekt", "finansinntekt"), ("driftskostnad", "finanskostnad")),
+    "eiendel": (("anleggsmiddel", "omloepsmiddel"), ()),
+    "gjeldOgEgenkapital": (("egenkapital", "langsiktigGjeld", "kortsiktigGjeld", "gjeldInnenBankOgForsikring"), ()),
+}
+
+VIRKSOMHETSTYPER = {
+    "enkeltpersonforetak": 0.80,
+    "selskapMedDeltakerfastsetting": 0.17,
+    "samvirkeforetak": 0.03,
+}
+REGNSKAPSPLIKTSTYPER = {
+    "ingenRegnskapsplikt": 0.70,
+    "begrensetRegnskapsplikt": 0.25,
+    "fullRegnskapsplikt": 0.05,
+}
+
+# the share of submissions with skogbruk, and the mean number of skogOgToemmerkonto and skogfond
+SKOGBRUK_RATE = 0.03
+SKOG_OG_TOEMMERKONTO_MEAN = 1.2
+SKOGFOND_MEAN = 1.1
+
+# registreringstidspunkt is delivered with 0 to 7 fraction digits
+FRACTION_DIGITS = (0, 1, 2, 3, 3, 3, 6, 7)
+
+
+def post_type_weights(low: str, high: str) -> tuple[list[str], np.ndarray]:
+    """The post types in a range, the lower numbered, more general ones more frequent.
+
+    @param low: The first post type of the range.
+    @param high: The last post type of the range.
+    @return: The post types and their probabilities.
+    """
+    post_types = [post_type for post_type in POST_TYPES if low <= post_type <= high]
+    weights = 1.0 / np.arange(1, len(post_types) + 1)
+    return post_types, weights / weights.sum()
+
+
+def amount(rng: np.random.Generator) -> float:
+    """A whole kroner amount, log-normally distributed around 50 000."""
+    return float(round(rng.lognormal(mean=10.8, sigma=1.6)))
+
+
+def set_path(document: dict[str, Any], path: str, value: Any) -> None:
+    *parents, name = path.split(".")
+    for parent in parents:
+        document = document.setdefault(parent, {})
+    document[name] = value
+
+
+def registreringstidspunkt_string(timestamp: datetime, rng: np.random.Generator) -> str:
+    fraction_digits = FRACTION_DIGITS[rng.integers(len(FRACTION_DIGITS))]
+    fraction = f"{timestamp.microsecond:06d}{rng.integers(10)}"[:fraction_digits]
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S") + (f".{fraction}" if fraction else "") + "Z"
+
+
+class SubmissionGenerator:
+    """Makes the naeringsspesifikasjon documents, with the distributions set up once."""
+
+    def __init__(self, schema: pa.Schema, rng: np.random.Generator, inntektsaar: str = INNTEKTSAAR):
+        self.rng = rng
+        self.inntektsaar = inntektsaar
+        self.arrays = [(array_values, *profile, *post_type_weights(*profile[2]))
+                       for array_values, profile in ARRAY_PROFILES.items()]
+        self.sums = [value for value in registry_values(SECTION_REGISTRY) if isinstance(value, SumValue)]
+
+        skog_type = schema.field("naeringsspesifikasjon").type.field("skogbruk").type \
+            .field("skogOgToemmerkonto").type.value_type
+        self.skog_felts = [field.name for field in skog_type if pa.types.is_float64(field.type)]
+        self.skogfond_felts = [field.name for field in skog_type.field("skogfond").type.value_type
+                               if pa.types.is_float64(field.type)]
+
+    def choice(self, probabilities: dict[str, float]) -> str:
+        return str(self.rng.choice(list(probabilities), p=list(probabilities.values())))
+
+    def array_elements(self,
+                       presence: float,
+                       mean_length: float,
+                       post_types: list[str],
+                       probabilities: np.ndarray) -> list[dict[str, Any]]:
+        if self.rng.random() >= presence:
+            return []
+        length = 1 + self.rng.poisson(mean_length - 1)
+        return [{"id": f"{index}", "type": str(post_type), "beloep": amount(self.rng)}
+                for index, post_type in enumerate(self.rng.choice(post_types, size=length, p=probabilities))]
+
+    def skogbruk(self) -> dict[str, Any]:
+        if self.rng.random() >= SKOGBRUK_RATE:
+            return {"skogOgToemmerkonto": []}
+
+        kontoer = []
+        for konto_index in range(1 + self.rng.poisson(SKOG_OG_TOEMMERKONTO_MEAN - 1)):
+            konto: dict[str, Any] = {
+                "id": f"{konto_index}",
+                "driftsenhet": f"{self.rng.integers(1, 10)}",
+                "skogfond": [
+                    {"id": f"{fond_index}",
+                     "kommunenummer": f"{self.rng.integers(301, 5636):04d}",
+                     **{felt: amount(self.rng) for felt in self.skogfond_felts if self.rng.random() < 0.3}}
+                    for fond_index in range(1 + self.rng.poisson(SKOGFOND_MEAN - 1))
+                ],
+            }
+            konto.update({felt: amount(self.rng) for felt in self.skog_felts if self.rng.random() < 0.5})
+            kontoer.append(konto)
+        return {"skogOgToemmerkonto": kontoer}
+
+    def naeringsspesifikasjon(self, norsk_identifikator: str) -> dict[str, Any]:
+        document: dict[str, Any] = {
+            "norskIdentifikator": norsk_identifikator,
+            "inntektsaar": self.inntektsaar,
+            "virksomhet": {
+                "virksomhetstype": self.choice(VIRKSOMHETSTYPER),
+                "regnskapspliktstype": self.choice(REGNSKAPSPLIKTSTYPER),
+                "regnskapsperiode": {"start": f"{self.inntektsaar}-01-01", "slutt": f"{self.inntektsaar}-12-31"},
+            },
+            "skogbruk": self.skogbruk(),
+        }
+
+        undertema_sums: dict[str, float] = {}
+        for array_values, presence, mean_length, _, post_types, probabilities in self.arrays:
+            elements = self.array_elements(presence, mean_length, post_types, probabilities)
+            set_path(document, array_values.path, elements)
+            undertema_sums[array_values.undertema] = undertema_sums.get(array_values.undertema, 0.0) \
+                + sum(element["beloep"] for element in elements)
+
+        for sum_value in self.sums:
+            added, subtracted = COMBINED_SUMS.get(sum_value.undertema, ((sum_value.undertema,), ()))
+            set_path(document, sum_value.path,
+                     sum(undertema_sums.get(undertema, 0.0) for undertema in added)
+                     - sum(undertema_sums.get(undertema, 0.0) for undertema in subtracted))
+
+        return document
+
+
+def generate_avro_records(num_records: int = NUM_RECORDS,
+                          duplicate_rate: float = DUPLICATE_RATE,
+                          inntektsaar: str = INNTEKTSAAR,
+                          seed: int = SEED) -> Iterator[dict[str, Any]]:
+    """Generates the Avro records, one submission at a time.
+
+    Each id is submitted once, or with probability duplicate_rate one or more
+    times again later, with new amounts, a later registreringstidspunkt and a
+    higher sekvensnummer, so only the last submission is the latest.
+
+    @param num_records: The number of records, including resubmissions.
+    @param duplicate_rate: The share of ids submitted again.
+    @param inntektsaar: The income year of the submissions.
+    @param seed: The random seed, the same seed gives the same records.
+    @return: An iterator over the Avro records.
+    """
+    rng = np.random.default_rng(seed)
+    submissions = SubmissionGenerator(read_naering_arrow_schema(), rng, inntektsaar)
+    first_registrering = datetime(int(inntektsaar) + 1, 3, 1, tzinfo=timezone.utc)
+
+    sekvensnummer = 0
+    identifikator = 0
+    while sekvensnummer < num_records:
+        identifikator += 1
+        registrering = first_registrering + timedelta(seconds=float(rng.uniform(0, 60 * 24 * 3600)))
+
+        num_submissions = 1 + (rng.geometric(0.7) if rng.random() < duplicate_rate else 0)
+        for _ in range(min(num_submissions, num_records - sekvensnummer)):
+            sekvensnummer += 1
+            hendelse = {
+                "sekvensnummer": sekvensnummer,
+                "identifikator": f"{identifikator}",
+                "gjelderPeriode": inntektsaar,
+                "registreringstidspunkt": registreringstidspunkt_string(registrering, rng),
+                "hendelsetype": "ny",
+                "typeSkattepliktig": "personligSkattepliktig",
+            }
+            yield {"data": {
+                "hendelse": json.dumps(hendelse),
+                "naeringsspesifikasjon": json.dumps(submissions.naeringsspesifikasjon(f"{identifikator:011d}")),
+            }}
+            registrering += timedelta(seconds=float(rng.uniform(60, 14 * 24 * 3600)))
+
+
+def main(avro_filename: str,
+         num_records: int = NUM_RECORDS,
+         duplicate_rate: float = DUPLICATE_RATE,
+         inntektsaar: str = INNTEKTSAAR,
+         seed: int = SEED,
+         codec: str = "deflate") -> None:
+    start_time = timeit.default_timer()
+
+    with open(avro_filename, "wb") as avro_file:
+        fastavro.writer(avro_file,
+                        fastavro.parse_schema(AVRO_SCHEMA),
+                        generate_avro_records(num_records, duplicate_rate, inntektsaar, seed),
+                        codec=codec)
+
+    logging.info("Wrote %d synthetic records to %s in %.3g seconds",
+                 num_records, avro_filename, timeit.default_timer() - start_time)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("avro_filename", help="the Avro file to write")
+    parser.add_argument("--records", type=int, default=NUM_RECORDS, help="number of records, including resubmissions")
+    parser.add_argument("--duplicate-rate", type=float, default=DUPLICATE_RATE, help="share of ids submitted again")
+    parser.add_argument("--inntektsaar", default=INNTEKTSAAR)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--codec", default="deflate", choices=["null", "deflate", "snappy"])
+    args = parser.parse_args()
+
+    main(args.avro_filename, args.records, args.duplicate_rate, args.inntektsaar, args.seed, args.codec)
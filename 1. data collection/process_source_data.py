@@ -1,175 +1,136 @@
+import hashlib
 import json
 import logging
+import re
+import resource
+import tempfile
+import threading
+import time
 import timeit
-from datetime import datetime
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
 from io import BytesIO
-from typing import Any
-import pandas as pd
-import dapla as dp
+from itertools import islice
+from pathlib import Path
+from typing import Any, BinaryIO
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pa_ds
+import pyarrow.fs as pa_fs
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
 import fastavro
 import duckdb
+import psutil
+
+import storage
 
 DEST_BUCKET_NAME = "gs://ssb-sirius-editering-data-produkt-prod/test"
 
+# Spark printSchema() dump of the delivered data, used as the Arrow schema when streaming
+NAERING_SCHEMA_FILE = Path(__file__).resolve().parent.parent / "naeringsspesifikasjon_2023_prod.txt"
 
-# ##### Resultregnskap  ######
+# record of the source files already ingested by main_incremental, kept next to the snapshot
+MANIFEST_FILENAME = f"{DEST_BUCKET_NAME}/processed-source-files.json"
 
-SKATT_NAERING_SQL = """
-   WITH naeringsspesifikasjon_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(                  
-                --- driftsinntekt
-
-                SELECT {'felt' : inntekt.type, 'beloep' : inntekt.beloep}
-                FROM UNNEST(resultatregnskap.driftsinntekt.salgsinntekt.inntekt)
-
-                UNION ALL                
-                SELECT {'felt' : inntekt.type, 'beloep' : inntekt.beloep}
-                FROM UNNEST(resultatregnskap.driftsinntekt.annenDriftsinntekt.inntekt)
-
-                -- driftskostnad
-                                
-                UNION ALL    
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.driftskostnad.varekostnad.kostnad)
-
-                UNION ALL    
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.driftskostnad.loennskostnad.kostnad)
-
-                UNION ALL    
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.driftskostnad.annenDriftskostnad.kostnad)
-
-                -- finansinntekt
-                UNION ALL    
-                SELECT {'felt' : inntekt.type, 'beloep' : inntekt.beloep}
-                FROM UNNEST(resultatregnskap.finansinntekt.inntekt)
-
-                -- finanskostnad
-                UNION ALL    
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.finanskostnad.kostnad)
-                          
-                -- 9000 sumDriftsinntekt
-                UNION ALL
-                SELECT {'felt' : 'sumDriftsinntekt', 'beloep' : resultatregnskap.driftsinntekt.sumDriftsinntekt}
-
-                -- 9010 sumDriftskostnad
-                UNION ALL
-                SELECT {'felt' : 'sumDriftskostnad', 'beloep' : resultatregnskap.driftskostnad.sumDriftskostnad}
-
-                -- 9060 sumFinansinntekt
-                UNION ALL
-                SELECT {'felt' : 'sumFinansinntekt', 'beloep' : resultatregnskap.sumFinansinntekt}
-
-                -- 9070 sumFinanskostnad
-                UNION ALL
-                SELECT {'felt' : 'sumFinanskostnad', 'beloep' : resultatregnskap.sumFinanskostnad}
-
-                -- 9200 aarsresultat
-                UNION ALL
-                SELECT {'felt' : 'aarsresultat', 'beloep' : resultatregnskap.aarsresultat}
-
-                -- 9300 sumBalanseverdiForAnleggsmiddel
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumBalanseverdiForAnleggsmiddel', 
-                    'beloep' : balanseregnskap.anleggsmiddel.sumBalanseverdiForAnleggsmiddel
-                }
-
-                -- 9350 sumBalanseverdiForOmloepsmiddel
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumBalanseverdiForOmloepsmiddel', 
-                    'beloep' : balanseregnskap.omloepsmiddel.sumBalanseverdiForOmloepsmiddel
-                }
-
-                -- 9400 sumBalanseverdiForEiendel
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumBalanseverdiForEiendel', 
-                    'beloep' : balanseregnskap.sumBalanseverdiForEiendel
-                }
-
-                -- 9450 sumEgenkapital
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumEgenkapital', 
-                    'beloep' : balanseregnskap.gjeldOgEgenkapital.sumEgenkapital
-                }
-                                                        
-                -- 9500 sumLangsiktigGjeld
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumLangsiktigGjeld', 
-                    'beloep' : balanseregnskap.gjeldOgEgenkapital.sumLangsiktigGjeld
-                }
-
-                -- 9550 sumKortsiktigGjeld
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumKortsiktigGjeld', 
-                    'beloep' : balanseregnskap.gjeldOgEgenkapital.sumKortsiktigGjeld
-                }
-
-                -- 9650 sumGjeldOgEgenkapital
-                UNION ALL   
-                SELECT {
-                    'felt' : 'sumGjeldOgEgenkapital', 
-                    'beloep' : balanseregnskap.sumGjeldOgEgenkapital
-                }
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+# latest submission per norskIdentifikator and inntektsaar, merged with new deliveries by main_incremental
+SNAPSHOT_FILENAME = f"{DEST_BUCKET_NAME}/latest-naeringsspesifikasjon.parquet"
+
+# naering_langt of the previous run, compared with the current one for the change output
+LONG_SNAPSHOT_FILENAME = f"{DEST_BUCKET_NAME}/naering-langt-snapshot.parquet"
+
+# bump when a change alters the section outputs, so cached results are not reused
+PIPELINE_VERSION = "1"
+
+# content-addressed section results, with an index.json of sizes and last use
+SECTION_CACHE_DIRNAME = f"{DEST_BUCKET_NAME}/section-cache"
+
+# size limit of the section cache, least recently used results are evicted beyond it
+SECTION_CACHE_MAX_BYTES = 10 << 30
+
+# the original structure written by main next to the sections
+ORIGINAL_STRUCTURE_SQL = "SELECT * FROM arrow_table"
+
+# number of sections processed concurrently by default
+SECTION_WORKERS = 4
 
+# how often the resident memory of the process is sampled while a stage is timed
+RSS_SAMPLE_INTERVAL = 0.01
+
+# Hive partition columns of the long sections when writing partitioned datasets
+PARTITION_COLUMNS = ["inntektsaar", "hovedtema", "undertema"]
+
+# rows per row group of sorted output, small enough for id lookups to skip most row groups
+LOOKUP_ROW_GROUP_SIZE = 64 * 1024
+
+# number of Avro records decoded into each Arrow record batch when streaming
+AVRO_BATCH_SIZE = 10_000
+
+# block size for the Arrow JSON parser, every JSON document must fit within one block
+JSON_BLOCK_SIZE = 16 << 20
+
+# splits a registreringstidspunkt string the way convert_timestamp_string_to_iso_format reads it
+REGISTRERINGSTIDSPUNKT_PATTERN = (
+    r"^(?P<date>\d{4}-\d{2}-\d{2}).(?P<time>\d{2}:\d{2}(?::\d{2})?)"
+    r"(?P<dot>\.?)(?P<fraction>\d{0,6})(?P<rest>.*)$"
+)
+
+SPARK_TO_ARROW_TYPES = {
+    "string": pa.string(),
+    "long": pa.int64(),
+    "integer": pa.int32(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+}
+
+
+# ##### Latest submission ######
+
+# the latest submission per norskIdentifikator and inntektsaar, in the original structure
+LATEST_SUBMISSIONS_SQL = """
     SELECT
-        inntektsaar,
-        norskIdentifikator AS id,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        registreringstidspunkt,
-        sekvensnummer
+        *
     FROM
-        naeringsspesifikasjon_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
+        arrow_table
+    WHERE
+        naeringsspesifikasjon.norskIdentifikator IS NOT NULL
+        AND naeringsspesifikasjon.inntektsaar IS NOT NULL
+    QUALIFY
+        ROW_NUMBER() OVER (
+            PARTITION BY naeringsspesifikasjon.norskIdentifikator, naeringsspesifikasjon.inntektsaar
+            ORDER BY hendelse.registreringstidspunkt DESC, hendelse.sekvensnummer DESC
+        ) = 1
+"""
+
+# every section reads the latest submission per norskIdentifikator and inntektsaar from this table
+LATEST_NAERINGSSPESIFIKASJON_SQL = f"""
+    CREATE OR REPLACE TABLE latest_naeringsspesifikasjon AS
+    SELECT
+        naeringsspesifikasjon.*,
+        hendelse.registreringstidspunkt,
+        hendelse.sekvensnummer
+    FROM
+        ({LATEST_SUBMISSIONS_SQL})
 """
 
 
+# ##### Skogbruk ######
+
 SKOG_OG_TOEMMERKONTO_SQL = """
     WITH skog_og_toemmerkonto AS (
         SELECT
-            naeringsspesifikasjon.norskIdentifikator AS norskIdentifikator,
-            CAST(naeringsspesifikasjon.inntektsaar AS INT64) AS inntektsaar,
-            hendelse.registreringstidspunkt AS registreringstidspunkt,
-            hendelse.sekvensnummer AS sekvensnummer,
-            UNNEST(naeringsspesifikasjon.skogbruk.skogOgToemmerkonto, recursive := true)
+            norskIdentifikator,
+            CAST(inntektsaar AS INT64) AS inntektsaar,
+            registreringstidspunkt,
+            sekvensnummer,
+            UNNEST(skogbruk.skogOgToemmerkonto, recursive := true)
         FROM 
-            arrow_table
+            latest_naeringsspesifikasjon
         WHERE 
-            ARRAY_LENGTH(naeringsspesifikasjon.skogbruk.skogOgToemmerkonto) > 0 
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1
+            ARRAY_LENGTH(skogbruk.skogOgToemmerkonto) > 0 
     ), 
     skog_og_toemmerkonto_unpivot AS ( 
         UNPIVOT skog_og_toemmerkonto
@@ -188,19 +149,17 @@ SKOG_OG_TOEMMERKONTO_SQL = """
 SKOGFOND_SQL = """
     WITH skogfond AS (
         SELECT
-            naeringsspesifikasjon.norskIdentifikator AS norskIdentifikator,
-            CAST(naeringsspesifikasjon.inntektsaar AS INT64) AS inntektsaar,
-            hendelse.registreringstidspunkt AS registreringstidspunkt,
-            hendelse.sekvensnummer AS sekvensnummer,
+            root.norskIdentifikator AS norskIdentifikator,
+            CAST(root.inntektsaar AS INT64) AS inntektsaar,
+            root.registreringstidspunkt AS registreringstidspunkt,
+            root.sekvensnummer AS sekvensnummer,
             skogOgToemmerkonto.id AS skogOgToemmerkontoId,
             UNNEST(skogOgToemmerkonto.skogfond, recursive := true)
         FROM
-            arrow_table AS root,
-            UNNEST(root.naeringsspesifikasjon.skogbruk.skogOgToemmerkonto)
+            latest_naeringsspesifikasjon AS root,
+            UNNEST(root.skogbruk.skogOgToemmerkonto)
         WHERE
-            ARRAY_LENGTH(root.naeringsspesifikasjon.skogbruk.skogOgToemmerkonto) > 0            
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
+            ARRAY_LENGTH(root.skogbruk.skogOgToemmerkonto) > 0            
     ),
     skogfond_unpivot AS ( 
         UNPIVOT skogfond
@@ -216,877 +175,609 @@ SKOGFOND_SQL = """
     ORDER BY norskIdentifikator, inntektsaar, skogOgToemmerkontoId, kommunenummer, felt                      
 """
 
-# +
-DRIFTSINNTEKT_SQL = """
-   WITH naeringsspesifikasjon_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(                  
-                --- driftsinntekt
+# ##### Section registry ######
 
-                SELECT {'felt' : inntekt.type, 'beloep' : inntekt.beloep}
-                FROM UNNEST(resultatregnskap.driftsinntekt.salgsinntekt.inntekt)
+@dataclass(frozen=True)
+class ArrayValues:
+    """A nested array of {type, beloep} elements, each giving one felt and beloep.
 
-                UNION ALL                
-                SELECT {'felt' : inntekt.type, 'beloep' : inntekt.beloep}
-                FROM UNNEST(resultatregnskap.driftsinntekt.annenDriftsinntekt.inntekt)
+    @ivar path: The path of the array in naeringsspesifikasjon, its last part names the elements.
+    @ivar hovedtema: The main theme, resultatregnskap or balanseregnskap.
+    @ivar undertema: The theme within the main theme.
+    @ivar gruppe: The group within the theme.
+    """
+    path: str
+    hovedtema: str
+    undertema: str
+    gruppe: str
 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        sekvensnummer
-    FROM
-        naeringsspesifikasjon_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+@dataclass(frozen=True)
+class SumValue:
+    """A scalar sum field, giving one felt and beloep.
 
+    @ivar felt: The felt of the sum.
+    @ivar path: The path of the sum in naeringsspesifikasjon.
+    @ivar hovedtema: The main theme, resultatregnskap or balanseregnskap.
+    @ivar undertema: The theme summed up.
+    @ivar gruppe: Always 'sum'.
+    """
+    felt: str
+    path: str
+    hovedtema: str
+    undertema: str
+    gruppe: str = "sum"
 
 
+# output columns of the long sections
+LONG_COLUMNS = ("inntektsaar", "id", "felt", "beloep", "registreringstidspunkt", "sekvensnummer")
 
-# -
+# output columns of the resultatregnskap sections
+RESULTAT_COLUMNS = ("felt", "beloep", "sekvensnummer")
 
-DRIFTSKOSTNAD_SQL = """
-   WITH naeringsspesifikasjon_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(            
-            
-                -- varekostnad
-                                 
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.driftskostnad.varekostnad.kostnad)
-                
-                --- loennskostnad
-
-                UNION ALL    
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.driftskostnad.loennskostnad.kostnad)
-                
-                --- annenDriftskostnad
-
-                UNION ALL    
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.driftskostnad.annenDriftskostnad.kostnad)
+# output columns of most balanseregnskap sections
+BALANSE_COLUMNS = ("sekvensnummer", "felt", "beloep")
 
+# output columns of naering_langt, the tags are used to pick the values of each section
+LANGT_COLUMNS = ("inntektsaar", "id", "hovedtema", "undertema", "gruppe", "felt", "beloep",
+                 "registreringstidspunkt", "sekvensnummer")
 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        sekvensnummer
-    FROM
-        naeringsspesifikasjon_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+@dataclass(frozen=True)
+class SectionSpec:
+    """A section written by main, described by the arrays and sums it holds.
 
+    @ivar file_prefix: The prefix of the section filename.
+    @ivar values: The arrays and sums of the section, in output order.
+    @ivar columns: The output columns, in order.
+    """
+    file_prefix: str
+    values: tuple[ArrayValues | SumValue, ...]
+    columns: tuple[str, ...] = RESULTAT_COLUMNS
+
+
+# resultatregnskap
+SALGSINNTEKT = ArrayValues("resultatregnskap.driftsinntekt.salgsinntekt.inntekt",
+                           "resultatregnskap", "driftsinntekt", "salgsinntekt")
+ANNEN_DRIFTSINNTEKT = ArrayValues("resultatregnskap.driftsinntekt.annenDriftsinntekt.inntekt",
+                                  "resultatregnskap", "driftsinntekt", "annenDriftsinntekt")
+VAREKOSTNAD = ArrayValues("resultatregnskap.driftskostnad.varekostnad.kostnad",
+                          "resultatregnskap", "driftskostnad", "varekostnad")
+LOENNSKOSTNAD = ArrayValues("resultatregnskap.driftskostnad.loennskostnad.kostnad",
+                            "resultatregnskap", "driftskostnad", "loennskostnad")
+ANNEN_DRIFTSKOSTNAD = ArrayValues("resultatregnskap.driftskostnad.annenDriftskostnad.kostnad",
+                                  "resultatregnskap", "driftskostnad", "annenDriftskostnad")
+FINANSINNTEKT = ArrayValues("resultatregnskap.finansinntekt.inntekt",
+                            "resultatregnskap", "finansinntekt", "inntekt")
+FINANSKOSTNAD = ArrayValues("resultatregnskap.finanskostnad.kostnad",
+                            "resultatregnskap", "finanskostnad", "kostnad")
+
+SUM_DRIFTSINNTEKT = SumValue("sumDriftsinntekt", "resultatregnskap.driftsinntekt.sumDriftsinntekt",
+                             "resultatregnskap", "driftsinntekt")
+SUM_DRIFTSKOSTNAD = SumValue("sumDriftskostnad", "resultatregnskap.driftskostnad.sumDriftskostnad",
+                             "resultatregnskap", "driftskostnad")
+SUM_FINANSINNTEKT = SumValue("sumFinansinntekt", "resultatregnskap.sumFinansinntekt",
+                             "resultatregnskap", "finansinntekt")
+SUM_FINANSKOSTNAD = SumValue("sumFinanskostnad", "resultatregnskap.sumFinanskostnad",
+                             "resultatregnskap", "finanskostnad")
+AARSRESULTAT = SumValue("aarsresultat", "resultatregnskap.aarsresultat",
+                        "resultatregnskap", "aarsresultat")
+
+# balanseregnskap
+BALANSEVERDI_FOR_ANLEGGSMIDDEL = ArrayValues("balanseregnskap.anleggsmiddel.balanseverdiForAnleggsmiddel.balanseverdi",
+                                             "balanseregnskap", "anleggsmiddel", "balanseverdi")
+BALANSEVERDI_FOR_OMLOEPSMIDDEL = ArrayValues("balanseregnskap.omloepsmiddel.balanseverdiForOmloepsmiddel.balanseverdi",
+                                             "balanseregnskap", "omloepsmiddel", "balanseverdi")
+LANGSIKTIG_GJELD = ArrayValues("balanseregnskap.gjeldOgEgenkapital.langsiktigGjeld.gjeld",
+                               "balanseregnskap", "langsiktigGjeld", "gjeld")
+KORTSIKTIG_GJELD = ArrayValues("balanseregnskap.gjeldOgEgenkapital.kortsiktigGjeld.gjeld",
+                               "balanseregnskap", "kortsiktigGjeld", "gjeld")
+EGENKAPITAL = ArrayValues("balanseregnskap.gjeldOgEgenkapital.egenkapital.kapital",
+                          "balanseregnskap", "egenkapital", "kapital")
+GJELD_INNEN_BANK_OG_FORSIKRING = ArrayValues("balanseregnskap.gjeldOgEgenkapital.gjeldInnenBankOgForsikring.gjeld",
+                                             "balanseregnskap", "gjeldInnenBankOgForsikring", "gjeld")
+
+SUM_BALANSEVERDI_FOR_ANLEGGSMIDDEL = SumValue("sumBalanseverdiForAnleggsmiddel",
+                                              "balanseregnskap.anleggsmiddel.sumBalanseverdiForAnleggsmiddel",
+                                              "balanseregnskap", "anleggsmiddel")
+SUM_BALANSEVERDI_FOR_OMLOEPSMIDDEL = SumValue("sumBalanseverdiForOmloepsmiddel",
+                                              "balanseregnskap.omloepsmiddel.sumBalanseverdiForOmloepsmiddel",
+                                              "balanseregnskap", "omloepsmiddel")
+SUM_BALANSEVERDI_FOR_EIENDEL = SumValue("sumBalanseverdiForEiendel", "balanseregnskap.sumBalanseverdiForEiendel",
+                                        "balanseregnskap", "eiendel")
+SUM_LANGSIKTIG_GJELD = SumValue("sumLangsiktigGjeld", "balanseregnskap.gjeldOgEgenkapital.sumLangsiktigGjeld",
+                                "balanseregnskap", "langsiktigGjeld")
+SUM_KORTSIKTIG_GJELD = SumValue("sumKortsiktigGjeld", "balanseregnskap.gjeldOgEgenkapital.sumKortsiktigGjeld",
+                                "balanseregnskap", "kortsiktigGjeld")
+SUM_EGENKAPITAL = SumValue("sumEgenkapital", "balanseregnskap.gjeldOgEgenkapital.sumEgenkapital",
+                           "balanseregnskap", "egenkapital")
+SUM_GJELD_INNEN_BANK_OG_FORSIKRING = SumValue("sumGjeldInnenBankOgForsikring",
+                                              "balanseregnskap.gjeldOgEgenkapital.sumGjeldInnenBankOgForsikring",
+                                              "balanseregnskap", "gjeldInnenBankOgForsikring")
+SUM_GJELD_OG_EGENKAPITAL = SumValue("sumGjeldOgEgenkapital", "balanseregnskap.sumGjeldOgEgenkapital",
+                                    "balanseregnskap", "gjeldOgEgenkapital")
+
+# the felt/beloep sections written by main; a new theme only needs a new entry here
+SECTION_REGISTRY: list[SectionSpec] = [
+    SectionSpec("naering", (
+        SALGSINNTEKT, ANNEN_DRIFTSINNTEKT,
+        VAREKOSTNAD, LOENNSKOSTNAD, ANNEN_DRIFTSKOSTNAD,
+        FINANSINNTEKT,
+        FINANSKOSTNAD,
+        SUM_DRIFTSINNTEKT, SUM_DRIFTSKOSTNAD, SUM_FINANSINNTEKT, SUM_FINANSKOSTNAD, AARSRESULTAT,
+        SUM_BALANSEVERDI_FOR_ANLEGGSMIDDEL, SUM_BALANSEVERDI_FOR_OMLOEPSMIDDEL, SUM_BALANSEVERDI_FOR_EIENDEL,
+        SUM_EGENKAPITAL, SUM_LANGSIKTIG_GJELD, SUM_KORTSIKTIG_GJELD, SUM_GJELD_OG_EGENKAPITAL,
+    ), LONG_COLUMNS),
+    SectionSpec("driftsinntekt", (SALGSINNTEKT, ANNEN_DRIFTSINNTEKT)),
+    SectionSpec("driftskostnad", (VAREKOSTNAD, LOENNSKOSTNAD, ANNEN_DRIFTSKOSTNAD)),
+    SectionSpec("finansinntekt", (FINANSINNTEKT,)),
+    SectionSpec("finanskostnad", (FINANSKOSTNAD,)),
+    SectionSpec("sum_resultatregnskap", (
+        SUM_DRIFTSINNTEKT, SUM_DRIFTSKOSTNAD, SUM_FINANSINNTEKT, SUM_FINANSKOSTNAD, AARSRESULTAT,
+    )),
+    SectionSpec("balanseregnskap", (
+        SUM_BALANSEVERDI_FOR_ANLEGGSMIDDEL, BALANSEVERDI_FOR_ANLEGGSMIDDEL,
+        SUM_BALANSEVERDI_FOR_OMLOEPSMIDDEL, BALANSEVERDI_FOR_OMLOEPSMIDDEL,
+        SUM_LANGSIKTIG_GJELD, SUM_KORTSIKTIG_GJELD, SUM_EGENKAPITAL,
+        LANGSIKTIG_GJELD, KORTSIKTIG_GJELD, EGENKAPITAL,
+        SUM_BALANSEVERDI_FOR_EIENDEL, SUM_GJELD_OG_EGENKAPITAL,
+    ), LONG_COLUMNS),
+    SectionSpec("sum-balanseregnskap-anleggsmiddel", (SUM_BALANSEVERDI_FOR_ANLEGGSMIDDEL,)),
+    SectionSpec("balanseverdi-anleggsmiddel", (BALANSEVERDI_FOR_ANLEGGSMIDDEL,), BALANSE_COLUMNS),
+    SectionSpec("sum-balanseregnskap-omloepsmiddel", (SUM_BALANSEVERDI_FOR_OMLOEPSMIDDEL,), BALANSE_COLUMNS),
+    SectionSpec("balanseverdi-omloepsmiddel", (BALANSEVERDI_FOR_OMLOEPSMIDDEL,), BALANSE_COLUMNS),
+    SectionSpec("sum-langsiktig-gjeld", (SUM_LANGSIKTIG_GJELD,), BALANSE_COLUMNS),
+    SectionSpec("sum-kortsiktig-gjeld", (SUM_KORTSIKTIG_GJELD,), BALANSE_COLUMNS),
+    SectionSpec("sum-egenkapital", (SUM_EGENKAPITAL,), BALANSE_COLUMNS),
+    SectionSpec("langsiktig-gjeld", (LANGSIKTIG_GJELD,), BALANSE_COLUMNS),
+    SectionSpec("kortsiktig-gjeld", (KORTSIKTIG_GJELD,), BALANSE_COLUMNS),
+    SectionSpec("egenkapital", (EGENKAPITAL,), BALANSE_COLUMNS),
+    SectionSpec("sum-gjeld-innen-bank-og-forsikring", (SUM_GJELD_INNEN_BANK_OG_FORSIKRING,), BALANSE_COLUMNS),
+    SectionSpec("gjeld-innen-bank-og-forsikring", (GJELD_INNEN_BANK_OG_FORSIKRING,), BALANSE_COLUMNS),
+    SectionSpec("sum-balanseverdi-for-eiendel", (SUM_BALANSEVERDI_FOR_EIENDEL,), BALANSE_COLUMNS),
+    SectionSpec("sum-gjeld-og-egenkapital", (SUM_GJELD_OG_EGENKAPITAL,), BALANSE_COLUMNS),
+]
+
+
+def value_struct_sql(value: ArrayValues | SumValue, tagged: bool = False) -> str:
+    """Creates the SELECT of one array or sum as {felt, beloep} structs.
+
+    @param value: The array or sum.
+    @param tagged: Whether to add hovedtema, undertema and gruppe to the structs.
+    @return: The SELECT.
+    """
+    tags = (f"hovedtema: '{value.hovedtema}', undertema: '{value.undertema}', gruppe: '{value.gruppe}', "
+            if tagged else "")
+    if isinstance(value, SumValue):
+        return f"SELECT {{{tags}felt: '{value.felt}', beloep: {value.path}}}"
 
-FINANSINNTEKT_SQL = """
-   WITH naeringsspesifikasjon_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(            
-            
-                -- finansinntekt
-  
-                SELECT {'felt' : inntekt.type, 'beloep' : inntekt.beloep}
-                FROM UNNEST(resultatregnskap.finansinntekt.inntekt)
+    element = value.path.rsplit(".", 1)[-1]
+    return (f"SELECT {{{tags}felt: {element}.type, beloep: {element}.beloep}}\n"
+            f"                FROM UNNEST({value.path})")
 
 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+def unnest_values_sql(values: tuple[ArrayValues | SumValue, ...],
+                      columns: tuple[str, ...],
+                      tagged: bool = False) -> str:
+    """Creates a SQL unnesting arrays and sums of latest_naeringsspesifikasjon into long rows.
 
-    SELECT
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        sekvensnummer
-    FROM
-        naeringsspesifikasjon_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+    The values are collected in one array of structs per submission and
+    unnested once, dropping missing and zero amounts.
 
-FINANSKOSTNAD_SQL = """
+    @param values: The arrays and sums to unnest.
+    @param columns: The output columns, in order.
+    @param tagged: Whether to add hovedtema, undertema and gruppe to the rows.
+    @return: The SQL.
+    """
+    column_expressions = {
+        "inntektsaar": "inntektsaar",
+        "id": "norskIdentifikator AS id",
+        "registreringstidspunkt": "registreringstidspunkt",
+        "sekvensnummer": "sekvensnummer",
+    }
+    value_selects = "\n\n                UNION ALL\n                ".join(
+        value_struct_sql(value, tagged) for value in values
+    )
+    select_columns = ",\n        ".join(
+        column_expressions.get(column, f"type_and_amount_unnested.type_and_amount.{column}")
+        for column in columns
+    )
+
+    return f"""
    WITH naeringsspesifikasjon_numbers AS (
         SELECT
             norskIdentifikator,
             CAST(inntektsaar AS INT64) AS inntektsaar,
             registreringstidspunkt,
             sekvensnummer,
-            ARRAY(            
-            
-                -- finanskostnad
-                SELECT {'felt' : kostnad.type, 'beloep' : kostnad.beloep}
-                FROM UNNEST(resultatregnskap.finanskostnad.kostnad)
-
-
+            ARRAY(
+                {value_selects}
             ) AS type_and_amount
         FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
+            latest_naeringsspesifikasjon
     )
 
     SELECT
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        sekvensnummer
+        {select_columns}
     FROM
         naeringsspesifikasjon_numbers AS root,
         UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
+    WHERE
+        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL
         AND type_and_amount_unnested.type_and_amount.beloep != 0.0
 """
 
 
-SUM_RESULTATREGNSKAP_SQL = """
-   WITH naeringsspesifikasjon_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(            
-            
-                -- 9000 sumDriftsinntekt
-                SELECT {'felt' : 'sumDriftsinntekt', 'beloep' : resultatregnskap.driftsinntekt.sumDriftsinntekt}
+def section_sql(spec: SectionSpec) -> str:
+    """Creates the SQL of a section, unnesting its own arrays and sums.
 
-                -- 9010 sumDriftskostnad
-                UNION ALL
-                SELECT {'felt' : 'sumDriftskostnad', 'beloep' : resultatregnskap.driftskostnad.sumDriftskostnad}
+    @param spec: The section.
+    @return: The section SQL.
+    """
+    return unnest_values_sql(spec.values, spec.columns)
 
-                -- 9060 sumFinansinntekt
-                UNION ALL
-                SELECT {'felt' : 'sumFinansinntekt', 'beloep' : resultatregnskap.sumFinansinntekt}
 
-                -- 9070 sumFinanskostnad
-                UNION ALL
-                SELECT {'felt' : 'sumFinanskostnad', 'beloep' : resultatregnskap.sumFinanskostnad}
+def registry_values(registry: list[SectionSpec]) -> tuple[ArrayValues | SumValue, ...]:
+    """Collects every array and sum used by the sections, once each.
 
-                -- 9200 aarsresultat
-                UNION ALL
-                SELECT {'felt' : 'aarsresultat', 'beloep' : resultatregnskap.aarsresultat}
+    @param registry: The sections.
+    @return: The arrays and sums, in order of first use.
+    """
+    return tuple(dict.fromkeys(value for spec in registry for value in spec.values))
 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        sekvensnummer
-    FROM
-        naeringsspesifikasjon_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
+def projection_sql(spec: SectionSpec, columns: tuple[str, ...] | None = None) -> str:
+    """Creates the SQL of a section as a filtered projection of naering_langt.
+
+    @param spec: The section.
+    @param columns: The output columns, the columns of the section if None.
+    @return: The section SQL.
+    """
+    conditions = "\n        OR ".join(
+        f"(gruppe = 'sum' AND felt = '{value.felt}')" if isinstance(value, SumValue)
+        else f"(hovedtema = '{value.hovedtema}' AND undertema = '{value.undertema}' AND gruppe = '{value.gruppe}')"
+        for value in spec.values
+    )
+    return f"""
+    SELECT {", ".join(columns or spec.columns)}
+    FROM naering_langt
+    WHERE
+        {conditions}
 """
 
-# ###### BALANSEREGNSKAP #######
 
-BALANSEREGNSKAP_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                -- sumBalanseverdiForAnleggsmiddel
-                SELECT {felt: 'sumBalanseverdiForAnleggsmiddel', beloep: balanseregnskap.anleggsmiddel.sumBalanseverdiForAnleggsmiddel}
-
-                UNION ALL
-                -- balanseverdiForAnleggsmiddel
-                SELECT {felt: balanseverdi.type, beloep: balanseverdi.beloep}
-                FROM UNNEST(balanseregnskap.anleggsmiddel.balanseverdiForAnleggsmiddel.balanseverdi)
-
-                UNION ALL
-                -- sumBalanseverdiForOmloepsmiddel
-                SELECT {felt: 'sumBalanseverdiForOmloepsmiddel', beloep: balanseregnskap.omloepsmiddel.sumBalanseverdiForOmloepsmiddel}
-
-                UNION ALL
-                -- balanseverdiForOmloepsmiddel
-                SELECT {felt: balanseverdi.type, beloep: balanseverdi.beloep}
-                FROM UNNEST(balanseregnskap.omloepsmiddel.balanseverdiForOmloepsmiddel.balanseverdi) 
-
-                UNION ALL
-                -- sumLangsiktigGjeld
-                SELECT {felt: 'sumLangsiktigGjeld', beloep: balanseregnskap.gjeldOgEgenkapital.sumLangsiktigGjeld}
-
-                UNION ALL
-                -- sumKortsiktigGjeld
-                SELECT {felt: 'sumKortsiktigGjeld', beloep: balanseregnskap.gjeldOgEgenkapital.sumKortsiktigGjeld}
-
-                UNION ALL
-                -- sumEgenkapital
-                SELECT {felt: 'sumEgenkapital', beloep: balanseregnskap.gjeldOgEgenkapital.sumEgenkapital}
-
-                UNION ALL
-                -- langsiktigGjeld
-                SELECT {felt: gjeld.type, beloep: gjeld.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.langsiktigGjeld.gjeld) 
-
-                UNION ALL
-                -- kortsiktigGjeld
-                SELECT {felt: gjeld.type, beloep: gjeld.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.kortsiktigGjeld.gjeld) 
-
-                UNION ALL
-                -- egenkapital
-                SELECT {felt: kapital.type, beloep: kapital.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.egenkapital.kapital) 
-
-                UNION ALL
-                -- sumBalanseverdiForEiendel
-                SELECT {felt: 'sumBalanseverdiForEiendel', beloep: balanseregnskap.sumBalanseverdiForEiendel}
-
-                UNION ALL
-                -- sumGjeldOgEgenkapital
-                SELECT {felt: 'sumGjeldOgEgenkapital', beloep: balanseregnskap.sumGjeldOgEgenkapital}
+# the skogbruk sections, which are not felt/beloep arrays and always run their own query
+SKOGBRUK_SECTIONS: list[tuple[str, str]] = [
+    ("skogbruk-skog-og-toemmerkonto", SKOG_OG_TOEMMERKONTO_SQL),
+    ("skogbruk-skogfond", SKOGFOND_SQL),
+]
 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+# the sections written by main, as (file prefix, section SQL)
+SECTIONS: list[tuple[str, str]] = SKOGBRUK_SECTIONS + [
+    (spec.file_prefix, section_sql(spec)) for spec in SECTION_REGISTRY
+]
 
-    SELECT
-        inntektsaar,
-        norskIdentifikator AS id,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        registreringstidspunkt,
-        sekvensnummer
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
 
+# ###### One-scan flattening #######
 
-SUM_BALANSERVERDI_FOR_ANLEGGSMIDDEL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-            
-                -- sumBalanseverdiForAnleggsmiddel
-                SELECT {'felt' : 'sumBalanseverdiForAnleggsmiddel', 'beloep' : balanseregnskap.anleggsmiddel.sumBalanseverdiForAnleggsmiddel}
-                
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+# every array and sum used by a section unnested in one fused scan into one long table,
+# tagged with hovedtema, undertema and gruppe; sums have gruppe 'sum'
+FLATTENED_SQL = ("CREATE OR REPLACE TABLE naering_langt AS"
+                 + unnest_values_sql(registry_values(SECTION_REGISTRY), LANGT_COLUMNS, tagged=True))
 
-    SELECT
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep,
-        sekvensnummer
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+# the sections written by main when flattening in one scan, as (file prefix, section SQL)
+ONE_SCAN_SECTIONS: list[tuple[str, str]] = SKOGBRUK_SECTIONS + [
+    (spec.file_prefix, projection_sql(spec)) for spec in SECTION_REGISTRY
+]
 
+# the long sections written as Hive-partitioned datasets, keeping the theme columns to partition on
+PARTITIONED_SECTIONS: dict[str, str] = {
+    spec.file_prefix: projection_sql(spec, columns=LONG_COLUMNS[:2] + ("hovedtema", "undertema") + LONG_COLUMNS[2:])
+    for spec in SECTION_REGISTRY
+    if spec.columns == LONG_COLUMNS
+}
 
-BALANSERVERDI_FOR_ANLEGGSMIDDEL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : balanseverdi.type, 'beloep' : balanseverdi.beloep}
-                FROM UNNEST(balanseregnskap.anleggsmiddel.balanseverdiForAnleggsmiddel.balanseverdi)
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+# ###### Wide format #######
 
-SUM_BALANSERVERDI_FOR_OMLOEPSMIDDEL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumBalanseverdiForOmloepsmiddel', 'beloep' : balanseregnskap.omloepsmiddel.sumBalanseverdiForOmloepsmiddel}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+# the known post types, each a p<type> column of the wide table whether or not it occurs,
+# taken from the RF-1175 derivations in 2. data cleaning/1175.py
+POST_TYPES = (
+    "1000", "1020", "1080", "1105", "1115", "1117", "1120", "1130", "1150", "1160", "1205", "1221",
+    "1225", "1238", "1239", "1280", "1290", "1295", "1296", "1298", "1350", "1360", "1370", "1380",
+    "1390", "1400", "1401", "1500", "1530", "1565", "1570", "1780", "1800", "1810", "1830", "1880",
+    "1895", "1900", "1920", "1950", "2000", "2015", "2050", "2080", "2095", "2096", "2097", "2098",
+    "2220", "2250", "2280", "2289", "2290", "2380", "2400", "2600", "2740", "2770", "2790", "2800",
+    "2900", "2910", "2949", "2950", "2990", "3000", "3100", "3200", "3300", "3400", "3410", "3600",
+    "3650", "3695", "3700", "3710", "3890", "3895", "3900", "3910", "4005", "4295", "4500", "4995",
+    "5000", "5300", "5400", "5420", "5600", "5900", "5950", "6000", "6100", "6200", "6300", "6340",
+    "6395", "6400", "6440", "6500", "6600", "6695", "6700", "6995", "6998", "7000", "7020", "7040",
+    "7080", "7099", "7155", "7165", "7295", "7330", "7350", "7400", "7420", "7500", "7565", "7600",
+    "7700", "7830", "7860", "7890", "7897", "7910", "7911", "8005", "8050", "8060", "8074", "8079",
+    "8090", "8091", "8105", "8150", "8160", "8174", "8179",
+)
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
 
-BALANSERVERDI_FOR_OMLOEPSMIDDEL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : balanseverdi.type, 'beloep' : balanseverdi.beloep}
-                FROM UNNEST(balanseregnskap.omloepsmiddel.balanseverdiForOmloepsmiddel.balanseverdi) 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+def wide_sql(post_types: tuple[str, ...], sum_felts: tuple[str, ...]) -> str:
+    """Creates the SQL pivoting naering_langt to one row per norskIdentifikator and inntektsaar.
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+    Every post type and sum gets a DOUBLE column, NULL where the submission
+    has no value, so sparse columns cost next to nothing in Parquet.
 
-SUM_LANGSIKTIGGJELD_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumLangsiktigGjeld', 'beloep' : balanseregnskap.gjeldOgEgenkapital.sumLangsiktigGjeld}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
+    @param post_types: The post types, each becoming a p<type> column.
+    @param sum_felts: The sum fields, each becoming a column of the same name.
+    @return: The SQL.
+    """
+    post_columns = ",\n        ".join(
+        f"CAST(SUM(beloep) FILTER (WHERE gruppe != 'sum' AND felt = '{post_type}') AS DOUBLE) AS p{post_type}"
+        for post_type in post_types
     )
-
+    sum_columns = ",\n        ".join(
+        f"CAST(SUM(beloep) FILTER (WHERE gruppe = 'sum' AND felt = '{sum_felt}') AS DOUBLE) AS {sum_felt}"
+        for sum_felt in sum_felts
+    )
+    return f"""
     SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
+        id AS norskIdentifikator,
+        inntektsaar,
+        MAX(registreringstidspunkt) AS registreringstidspunkt,
+        MAX(sekvensnummer) AS sekvensnummer,
+        {post_columns},
+        {sum_columns}
     FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
+        naering_langt
+    GROUP BY
+        id, inntektsaar
+    ORDER BY
+        norskIdentifikator, inntektsaar
 """
 
-SUM_KORTSIKTIGGJELD_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumKortsiktigGjeld', 'beloep' : balanseregnskap.gjeldOgEgenkapital.sumKortsiktigGjeld}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
+# the wide table of every post type and sum, written as naering-bredt
+WIDE_SQL = wide_sql(POST_TYPES,
+                    tuple(value.felt for value in registry_values(SECTION_REGISTRY) if isinstance(value, SumValue)))
+
+# post types in naering_langt without a column in the wide table
+UNKNOWN_POST_TYPES_SQL = f"""
+    SELECT DISTINCT felt
+    FROM naering_langt
+    WHERE gruppe != 'sum' AND felt NOT IN ({", ".join(f"'{post_type}'" for post_type in POST_TYPES)})
+    ORDER BY felt
 """
 
-SUM_EGENKAPITAL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumEgenkapital', 'beloep' : balanseregnskap.gjeldOgEgenkapital.sumEgenkapital}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+# ###### Change data capture #######
 
-LANGSIKTIGGJELD_SQL = """
-   WITH balanseregnskap_numbers AS (
+# inserted, changed and superseded (inntektsaar, id, felt) values between the previous
+# run's naering_langt, registered as previous_naering_langt, and the current one
+CHANGES_SQL = """
+    WITH current_values AS (
         SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : gjeld.type, 'beloep' : gjeld.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.langsiktigGjeld.gjeld) 
-            ) AS type_and_amount
+            inntektsaar,
+            id,
+            felt,
+            SUM(beloep) AS beloep,
+            MAX(sekvensnummer) AS sekvensnummer
         FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
-
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
-
-KORTSIKTIGGJELD_SQL = """
-   WITH balanseregnskap_numbers AS (
+            naering_langt
+        GROUP BY
+            inntektsaar, id, felt
+    ),
+    previous_values AS (
         SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : gjeld.type, 'beloep' : gjeld.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.kortsiktigGjeld.gjeld)
-            ) AS type_and_amount
+            inntektsaar,
+            id,
+            felt,
+            SUM(beloep) AS beloep,
+            MAX(sekvensnummer) AS sekvensnummer
         FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
-
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
-
-EGENKAPITAL_SQL = """
-   WITH balanseregnskap_numbers AS (
+            previous_naering_langt
+        GROUP BY
+            inntektsaar, id, felt
+    ),
+    current_submissions AS (
         SELECT
-            norskIdentifikator,
             CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : kapital.type, 'beloep' : kapital.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.egenkapital.kapital) 
-            ) AS type_and_amount
+            norskIdentifikator AS id,
+            sekvensnummer
         FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
+            latest_naeringsspesifikasjon
+    ),
+    changes AS (
+        SELECT
+            CASE
+                WHEN previous_values.felt IS NULL THEN 'inserted'
+                WHEN current_values.felt IS NULL THEN 'superseded'
+                ELSE 'changed'
+            END AS endringstype,
+            COALESCE(current_values.inntektsaar, previous_values.inntektsaar) AS inntektsaar,
+            COALESCE(current_values.id, previous_values.id) AS id,
+            COALESCE(current_values.felt, previous_values.felt) AS felt,
+            current_values.beloep,
+            previous_values.beloep AS forrige_beloep,
+            current_values.sekvensnummer,
+            previous_values.sekvensnummer AS forrige_sekvensnummer
+        FROM
+            current_values
+            FULL OUTER JOIN previous_values
+                ON current_values.inntektsaar = previous_values.inntektsaar
+                AND current_values.id = previous_values.id
+                AND current_values.felt = previous_values.felt
+        WHERE
+            previous_values.felt IS NULL
+            OR current_values.felt IS NULL
+            OR current_values.beloep IS DISTINCT FROM previous_values.beloep
     )
 
+    -- superseded values get the sekvensnummer of the submission replacing them
     SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
+        changes.endringstype,
+        changes.inntektsaar,
+        changes.id,
+        changes.felt,
+        changes.beloep,
+        changes.forrige_beloep,
+        COALESCE(changes.sekvensnummer, current_submissions.sekvensnummer, changes.forrige_sekvensnummer) AS sekvensnummer
     FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
+        changes
+        LEFT JOIN current_submissions
+            ON changes.inntektsaar = current_submissions.inntektsaar
+            AND changes.id = current_submissions.id
+    ORDER BY
+        sekvensnummer, changes.id, changes.inntektsaar, changes.felt
 """
 
 
-SUM_GJELD_INNEN_BANK_OG_FORSIKRING_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumGjeldInnenBankOgForsikring', 'beloep' : balanseregnskap.gjeldOgEgenkapital.sumGjeldInnenBankOgForsikring}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+# ###### Run metrics #######
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+def peak_rss_bytes() -> int:
+    """The peak resident memory of the process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
-GJELD_INNEN_BANK_OG_FORSIKRING_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : gjeld.type, 'beloep' : gjeld.beloep}
-                FROM UNNEST(balanseregnskap.gjeldOgEgenkapital.gjeldInnenBankOgForsikring.gjeld) 
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+@dataclass
+class StageMetrics:
+    """The metrics of one pipeline stage, accumulated over its timed blocks.
 
-SUM_BALANSERVERDI_FOR_EIENDEL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumBalanseverdiForEiendel', 'beloep' : balanseregnskap.sumBalanseverdiForEiendel}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
+    The CPU time and resident memory are those of the whole process while the
+    stage ran, so they include the DuckDB worker threads and any stages running
+    at the same time. Compare them between runs with the same max_workers.
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+    @ivar name: The stage, e.g. "json parse" or "naering upload".
+    @ivar wall_seconds: The wall time.
+    @ivar process_cpu_seconds: The CPU time of the process while the stage ran.
+    @ivar rows_in: The rows read by the stage, if known.
+    @ivar rows_out: The rows made by the stage, if known.
+    @ivar bytes_written: The bytes written to storage, if any.
+    @ivar process_peak_rss_bytes: The peak resident memory of the process while the stage ran.
+    """
+    name: str
+    wall_seconds: float = 0.0
+    process_cpu_seconds: float = 0.0
+    rows_in: int | None = None
+    rows_out: int | None = None
+    bytes_written: int | None = None
+    process_peak_rss_bytes: int = 0
 
-SUM_GJELD_OG_EGENKAPITAL_SQL = """
-   WITH balanseregnskap_numbers AS (
-        SELECT
-            norskIdentifikator,
-            CAST(inntektsaar AS INT64) AS inntektsaar,
-            registreringstidspunkt,
-            sekvensnummer,
-            ARRAY(
-                SELECT {'felt' : 'sumGjeldOgEgenkapital', 'beloep' : balanseregnskap.sumGjeldOgEgenkapital}
-            ) AS type_and_amount
-        FROM
-            (SELECT 
-                naeringsspesifikasjon.*,
-                hendelse.registreringstidspunkt,
-                hendelse.sekvensnummer
-            FROM 
-                arrow_table 
-            WHERE
-                naeringsspesifikasjon.norskIdentifikator IS NOT NULL
-                AND naeringsspesifikasjon.inntektsaar IS NOT NULL
-            ) AS naeringsspesifikasjon
-        QUALIFY 
-            ROW_NUMBER() OVER (PARTITION BY norskIdentifikator, inntektsaar ORDER BY registreringstidspunkt DESC) = 1            
-    )
 
-    SELECT
-        sekvensnummer,
-        type_and_amount_unnested.type_and_amount.felt,
-        type_and_amount_unnested.type_and_amount.beloep
-    FROM
-        balanseregnskap_numbers AS root,
-        UNNEST(root.type_and_amount) AS type_and_amount_unnested
-    WHERE 
-        type_and_amount_unnested.type_and_amount.beloep IS NOT NULL        
-        AND type_and_amount_unnested.type_and_amount.beloep != 0.0
-"""
+class ResidentMemorySampler:
+    """Samples the resident memory of the process in a background thread while any stage is timed,
+    keeping the peak of each stage.
+
+    One thread serves all stages, it runs only while a stage is being timed.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stages: dict[int, tuple[StageMetrics, int]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def sample(self, stages: list[StageMetrics]) -> None:
+        rss = self._process.memory_info().rss
+        with self._lock:
+            for stage in stages:
+                stage.process_peak_rss_bytes = max(stage.process_peak_rss_bytes, rss)
+
+    def start(self, stage: StageMetrics) -> None:
+        """Samples for the stage until stop is called as many times as start."""
+        self.sample([stage])
+        with self._lock:
+            _, count = self._stages.get(id(stage), (stage, 0))
+            self._stages[id(stage)] = (stage, count + 1)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+
+    def stop(self, stage: StageMetrics) -> None:
+        with self._lock:
+            _, count = self._stages[id(stage)]
+            if count > 1:
+                self._stages[id(stage)] = (stage, count - 1)
+            else:
+                del self._stages[id(stage)]
+        self.sample([stage])
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._stages:
+                    self._thread = None
+                    return
+                stages = [stage for stage, _ in self._stages.values()]
+            self.sample(stages)
+            time.sleep(self.interval)
+
+
+RSS_SAMPLER = ResidentMemorySampler()
+
+
+@contextmanager
+def timed(stage: StageMetrics | None) -> Iterator[None]:
+    """Adds the wall and process CPU time and the peak resident memory of the with block to a stage, if any."""
+    if stage is None:
+        yield
+        return
+
+    RSS_SAMPLER.start(stage)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        stage.wall_seconds += time.perf_counter() - wall_start
+        stage.process_cpu_seconds += time.process_time() - cpu_start
+        RSS_SAMPLER.stop(stage)
+
+
+class RunMetrics:
+    """The stage metrics of one run, written as one JSON summary."""
+
+    def __init__(self) -> None:
+        self.started = datetime.now(timezone.utc)
+        self.stages: list[StageMetrics] = []
+        self._wall_start, self._cpu_start = time.perf_counter(), time.process_time()
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, rows_in: int | None = None) -> StageMetrics:
+        """Adds a stage, safe to call from the section worker threads.
+
+        @param name: The stage name.
+        @param rows_in: The rows read by the stage, if known.
+        @return: The stage to time and fill in.
+        """
+        stage = StageMetrics(name, rows_in=rows_in)
+        with self._lock:
+            self.stages.append(stage)
+        return stage
+
+    def summary(self, **run_info: Any) -> dict[str, Any]:
+        """Sums up the run.
+
+        @param run_info: Information about the run to include, e.g. the source file.
+        @return: The summary with the total and per-stage metrics.
+        """
+        with self._lock:
+            stages = [asdict(stage) for stage in self.stages]
+        return {
+            **run_info,
+            "pipeline_version": PIPELINE_VERSION,
+            "started": self.started.isoformat(),
+            "wall_seconds": time.perf_counter() - self._wall_start,
+            "cpu_seconds": time.process_time() - self._cpu_start,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+        }
+
+    def write(self, destination_filename: str, **run_info: Any) -> None:
+        """Writes the summary as JSON.
+
+        @param destination_filename: The Google Cloud Storage path to write to.
+        @param run_info: Information about the run to include, e.g. the source file.
+        """
+        with storage.get_file_system().open(path=destination_filename, mode="w") as metrics_file:
+            json.dump(self.summary(**run_info), metrics_file, indent=2)
+        logging.info("Wrote metrics of %d stages to %s", len(self.stages), destination_filename)
 
 
 def convert_timestamp_string_to_iso_format(timestamp_as_string: str) -> datetime:
@@ -1101,32 +792,347 @@ def convert_timestamp_string_to_iso_format(timestamp_as_string: str) -> datetime
     )
 
 
-def read_avro_into_records(avro_content: BytesIO) -> list[dict[str, Any]]:
+def normalize_registreringstidspunkt(timestamps: pa.Array | pa.ChunkedArray) -> pa.Array | pa.ChunkedArray:
+    """Converts a column of registreringstidspunkt strings to timestamp[us, UTC].
+
+    Columnar version of convert_timestamp_string_to_iso_format, giving the
+    same result for the formats YYYY-MM-DDTHH:MM[:SS][.fraction][Z]. Like the
+    original, fractional seconds are truncated to milliseconds (microseconds
+    when the time has no seconds), anything after the Z or the kept fractional
+    digits is ignored, and without fractional seconds the time must be
+    followed by a Z. Other strings raise a ValueError.
+
+    @param timestamps: The registreringstidspunkt strings, nulls are kept.
+    @return: The timestamps in UTC.
+    """
+    parts = pc.extract_regex(timestamps, REGISTRERINGSTIDSPUNKT_PATTERN)
+    time = pc.struct_field(parts, "time")
+    fraction = pc.struct_field(parts, "fraction")
+    rest = pc.struct_field(parts, "rest")
+    has_fraction = pc.equal(pc.struct_field(parts, "dot"), ".")
+    has_seconds = pc.equal(pc.utf8_length(time), 8)
+    rest_is_zone = pc.match_substring_regex(rest, "^[Zz]")
+
+    # the original keeps the first 23 characters, i.e. 3 fractional digits after
+    # HH:MM:SS and 6 after HH:MM
+    kept_digits = pc.if_else(has_seconds, 3, 6)
+    is_valid = pc.and_(
+        pc.less_equal(pc.count_substring(timestamps, "."), 1),
+        pc.if_else(
+            has_fraction,
+            pc.or_(pc.greater_equal(pc.utf8_length(fraction), kept_digits),
+                   pc.or_(pc.equal(rest, ""), rest_is_zone)),
+            pc.and_(pc.equal(fraction, ""), rest_is_zone)
+        )
+    )
+    not_matching = pc.and_(pc.is_valid(timestamps), pc.invert(pc.fill_null(is_valid, False)))
+    if pc.any(not_matching).as_py():
+        first_index = pc.index(not_matching, True).as_py()
+        raise ValueError(f"Invalid registreringstidspunkt: {timestamps[first_index].as_py()!r}")
+
+    padded_fraction = pc.binary_join_element_wise(fraction, "000000", "")
+    fraction = pc.if_else(
+        has_seconds,
+        pc.utf8_slice_codeunits(padded_fraction, start=0, stop=3),
+        pc.utf8_slice_codeunits(padded_fraction, start=0, stop=6)
+    )
+    time = pc.if_else(has_seconds, time, pc.binary_join_element_wise(time, "00", ":"))
+    iso_timestamps = pc.binary_join_element_wise(
+        pc.struct_field(parts, "date"),
+        pc.if_else(has_fraction, pc.binary_join_element_wise(time, fraction, "."), time),
+        "T"
+    )
+
+    return pc.cast(pc.cast(iso_timestamps, pa.timestamp("us")), pa.timestamp("us", tz="UTC"))
+
+
+def read_spark_schema(schema_file: str | Path) -> pa.Schema:
+    """Reads a Spark printSchema() dump into an Arrow schema.
+
+    @param schema_file: The file with the printSchema() output.
+    @return: The schema as an Arrow schema.
+    """
+    with open(schema_file, encoding="utf-8") as file:
+        lines = [line.rstrip() for line in file if "|--" in line]
+
+    fields, _ = _parse_spark_schema_fields(lines, position=0, depth=0)
+    return pa.schema(fields)
+
+
+def _parse_spark_schema_fields(lines: list[str],
+                               position: int,
+                               depth: int) -> tuple[list[pa.Field], int]:
+    """Parses the printSchema() lines on one nesting level.
+
+    @param lines: The printSchema() lines.
+    @param position: The index of the first line on this level.
+    @param depth: The nesting level, 0 for the top level fields.
+    @return: The fields on this level and the index of the first line after them.
+    """
+    fields: list[pa.Field] = []
+    while position < len(lines):
+        line = lines[position]
+        if (line.index("|--") - 1) // 5 < depth:
+            break
+
+        name, spark_type = re.search(r"\|-- (\w+): (\w+)", line).groups()
+        position += 1
+
+        if spark_type in ("struct", "array", "map"):
+            children, position = _parse_spark_schema_fields(lines, position, depth + 1)
+            if spark_type == "struct":
+                arrow_type = pa.struct(children)
+            elif spark_type == "array":
+                arrow_type = pa.list_(children[0].type)
+            else:
+                arrow_type = pa.map_(children[0].type, children[1].type)
+        else:
+            arrow_type = SPARK_TO_ARROW_TYPES[spark_type]
+
+        fields.append(pa.field(name, arrow_type))
+
+    return fields, position
+
+
+def read_naering_arrow_schema(schema_file: str | Path = NAERING_SCHEMA_FILE) -> pa.Schema:
+    """Creates the Arrow schema of the records made by read_avro_into_records.
+
+    @param schema_file: The printSchema() dump of the delivered data.
+    @return: The schema with the hendelse and naeringsspesifikasjon columns.
+    """
+    spark_schema = read_spark_schema(schema_file)
+
+    # registreringstidspunkt is converted to a datetime (UTC) while reading
+    hendelse = pa.struct([
+        pa.field(field.name, pa.timestamp("us", tz="UTC"))
+        if field.name == "registreringstidspunkt" else field
+        for field in spark_schema.field("hendelse").type
+    ])
+
+    return pa.schema([
+        pa.field("hendelse", hendelse),
+        spark_schema.field("naeringsspesifikasjon")
+    ])
+
+
+def decode_avro_record(avro_record: dict[str, Any]) -> dict[str, Any]:
+    """Decodes the JSON payload of one Avro record.
+
+    @param avro_record: The Avro record.
+    @return: The record with hendelse and naeringsspesifikasjon as dicts.
+    """
+    hendelse: dict[str, Any] = json.loads(avro_record["data"]["hendelse"])
+    naeringsspesifikasjon: dict[str, Any] = json.loads(avro_record["data"]["naeringsspesifikasjon"])
+
+    # replace registreringstidspunkt with the datetime (UTC)
+    hendelse["registreringstidspunkt"] = convert_timestamp_string_to_iso_format(
+        hendelse['registreringstidspunkt']
+    )
+
+    return {
+        "hendelse": hendelse,
+        "naeringsspesifikasjon": naeringsspesifikasjon
+    }
+
+
+def read_avro_into_records(avro_content: BytesIO, metrics: RunMetrics | None = None) -> list[dict[str, Any]]:
     """Reads an Avro file into list of dicts.
 
     @param avro_content: The Avro file content.
+    @param metrics: The run metrics to add the avro decode and json parse stages to, if any.
     @return: The Avro file content as a list of dicts.
     """
     avro_reader = fastavro.reader(avro_content)
     _records: list[dict[str, Any]] = []
+    avro_stage = metrics.stage("avro decode") if metrics is not None else None
+    json_stage = metrics.stage("json parse") if metrics is not None else None
+
+    # read the records in chunks, so the stages are timed per chunk rather than per record
+    while True:
+        with timed(avro_stage):
+            avro_records: list[dict[str, Any]] = list(islice(avro_reader, AVRO_BATCH_SIZE))
+        if not avro_records:
+            break
+        with timed(json_stage):
+            _records.extend(decode_avro_record(avro_record) for avro_record in avro_records)
 
-    # read first n records
-    for avro_record in avro_reader:  # type: dict[str, Any]
-        # for production, we would use the following line
-        hendelse: dict[str, Any] = json.loads(avro_record["data"]["hendelse"])
-        naeringsspesifikasjon: dict[str, Any] = json.loads(avro_record["data"]["naeringsspesifikasjon"])
+    if metrics is not None:
+        avro_stage.rows_out = json_stage.rows_in = json_stage.rows_out = len(_records)
 
-        # replace registreringstidspunkt with the datetime (UTC)
-        hendelse["registreringstidspunkt"] = convert_timestamp_string_to_iso_format(
-            hendelse['registreringstidspunkt']
+    return _records
+
+
+def decode_json_column(json_strings: pa.Array, struct_type: pa.StructType) -> pa.StructArray:
+    """Parses a column of JSON documents into a typed struct array in one call.
+
+    The documents are joined into one newline delimited buffer and parsed by
+    the Arrow JSON reader against the given type, so no Python dicts are made.
+    Fields that are not in the type are ignored, missing fields become null.
+
+    @param json_strings: The JSON documents, one JSON object per element.
+    @param struct_type: The Arrow type of the documents.
+    @return: The documents as a struct array, in the same order.
+    """
+    if json_strings.null_count > 0:
+        raise ValueError("Cannot decode null JSON documents")
+    if len(json_strings) == 0:
+        return pa.array([], type=struct_type)
+
+    documents = pa.LargeListArray.from_arrays(
+        pa.array([0, len(json_strings)], type=pa.int64()),
+        json_strings.cast(pa.large_string())
+    )
+    ndjson = pc.binary_join(documents, pa.scalar("\n", type=pa.large_string()))[0]
+
+    table = pa_json.read_json(
+        pa.BufferReader(ndjson.as_buffer()),
+        read_options=pa_json.ReadOptions(block_size=JSON_BLOCK_SIZE),
+        parse_options=pa_json.ParseOptions(
+            explicit_schema=pa.schema(list(struct_type)),
+            newlines_in_values=True,
+            unexpected_field_behavior="ignore"
         )
+    )
+    if table.num_rows != len(json_strings):
+        raise ValueError(f"Decoded {table.num_rows} JSON documents, expected {len(json_strings)}")
+
+    return pa.StructArray.from_arrays(
+        [column.combine_chunks() for column in table.columns],
+        fields=list(struct_type)
+    )
 
-        _records.append({
-            "hendelse": hendelse,
-            "naeringsspesifikasjon": naeringsspesifikasjon
-        })
 
-    return _records
+def decode_avro_payload_batch(hendelse_json: list[str],
+                              naeringsspesifikasjon_json: list[str],
+                              schema: pa.Schema) -> pa.RecordBatch:
+    """Decodes the JSON payload columns of a chunk of Avro records.
+
+    @param hendelse_json: The data.hendelse strings.
+    @param naeringsspesifikasjon_json: The data.naeringsspesifikasjon strings.
+    @param schema: The Arrow schema of the batch, see read_naering_arrow_schema.
+    @return: The decoded record batch.
+    """
+    # registreringstidspunkt is a string in the JSON and converted afterwards
+    hendelse_type = schema.field("hendelse").type
+    hendelse_json_type = pa.struct([
+        pa.field(field.name, pa.string()) if field.name == "registreringstidspunkt" else field
+        for field in hendelse_type
+    ])
+    hendelse = decode_json_column(pa.array(hendelse_json, type=pa.string()), hendelse_json_type)
+
+    hendelse_children = [
+        normalize_registreringstidspunkt(hendelse.field(field.name))
+        if field.name == "registreringstidspunkt" else hendelse.field(field.name)
+        for field in hendelse_type
+    ]
+
+    naeringsspesifikasjon = decode_json_column(
+        pa.array(naeringsspesifikasjon_json, type=pa.string()),
+        schema.field("naeringsspesifikasjon").type
+    )
+
+    return pa.RecordBatch.from_arrays(
+        [pa.StructArray.from_arrays(hendelse_children, fields=list(hendelse_type)), naeringsspesifikasjon],
+        schema=schema
+    )
+
+
+def iter_avro_record_batches(avro_file: BinaryIO,
+                             schema: pa.Schema,
+                             batch_size: int = AVRO_BATCH_SIZE,
+                             metrics: RunMetrics | None = None) -> Iterator[pa.RecordBatch]:
+    """Reads an Avro file as a stream of Arrow record batches.
+
+    Only one batch of records is held in memory at a time, so the file is
+    never read into memory as a whole. The JSON payloads of each batch are
+    decoded column-wise by decode_avro_payload_batch.
+
+    @param avro_file: The Avro file, opened for reading.
+    @param schema: The Arrow schema of the batches, see read_naering_arrow_schema.
+    @param batch_size: The maximum number of records in each batch.
+    @param metrics: The run metrics to add the avro decode and json parse stages to, if any.
+    @return: An iterator over the record batches.
+    """
+    avro_reader = fastavro.reader(avro_file)
+    avro_stage = metrics.stage("avro decode") if metrics is not None else StageMetrics("avro decode")
+    json_stage = metrics.stage("json parse") if metrics is not None else StageMetrics("json parse")
+    avro_stage.rows_out = json_stage.rows_in = json_stage.rows_out = 0
+
+    while True:
+        with timed(avro_stage):
+            avro_records: list[dict[str, Any]] = list(islice(avro_reader, batch_size))
+        if not avro_records:
+            break
+        avro_stage.rows_out += len(avro_records)
+
+        # the JSON documents are parsed straight into Arrow, so this also covers the Arrow conversion
+        with timed(json_stage):
+            batch = decode_avro_payload_batch([avro_record["data"]["hendelse"] for avro_record in avro_records],
+                                              [avro_record["data"]["naeringsspesifikasjon"]
+                                               for avro_record in avro_records],
+                                              schema)
+        json_stage.rows_in += len(avro_records)
+        json_stage.rows_out += batch.num_rows
+        yield batch
+
+    logging.info("Decoded JSON payload of %d records in %.3g seconds (%.0f records per second)",
+                 json_stage.rows_out,
+                 json_stage.wall_seconds,
+                 json_stage.rows_out / json_stage.wall_seconds if json_stage.wall_seconds > 0 else 0.0)
+
+
+def iter_source_record_batches(source_files: list[str],
+                               schema: pa.Schema,
+                               snapshot_filename: str | None = None,
+                               metrics: RunMetrics | None = None) -> Iterator[pa.RecordBatch]:
+    """Reads several Avro files and an earlier snapshot as one stream of record batches.
+
+    @param source_files: The Google Cloud Storage Avro files to read, in order.
+    @param schema: The Arrow schema of the batches, see read_naering_arrow_schema.
+    @param snapshot_filename: A Parquet snapshot of earlier submissions to append, if it exists.
+    @param metrics: The run metrics to add the stages of each Avro file to, if any.
+    @return: An iterator over the record batches.
+    """
+    fs = storage.get_file_system()
+
+    for source_file in source_files:
+        with fs.open(path=source_file, mode="rb") as avro_file:
+            yield from iter_avro_record_batches(avro_file, schema=schema, metrics=metrics)
+
+    if snapshot_filename is not None and fs.exists(snapshot_filename):
+        with fs.open(path=snapshot_filename, mode="rb") as snapshot_file:
+            for record_batch in pq.ParquetFile(snapshot_file).iter_batches(batch_size=AVRO_BATCH_SIZE):
+                yield from pa.Table.from_batches([record_batch]).cast(schema).to_batches()
+
+
+def read_manifest(manifest_filename: str) -> dict[str, Any]:
+    """Reads the manifest of processed source files.
+
+    @param manifest_filename: The Google Cloud Storage path of the manifest.
+    @return: The manifest, empty if the file doesn't exist yet.
+    """
+    fs = storage.get_file_system()
+    if not fs.exists(manifest_filename):
+        return {"processed_files": []}
+
+    with fs.open(path=manifest_filename, mode="r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_manifest(manifest_filename: str, manifest: dict[str, Any]) -> None:
+    """Writes the manifest of processed source files.
+
+    The manifest is written to a temporary file first, so an interrupted run
+    never leaves a truncated manifest behind.
+
+    @param manifest_filename: The Google Cloud Storage path of the manifest.
+    @param manifest: The manifest.
+    """
+    fs = storage.get_file_system()
+    temporary_filename = f"{manifest_filename}.tmp"
+    with fs.open(path=temporary_filename, mode="w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    fs.mv(temporary_filename, manifest_filename)
 
 
 def create_filename(file_prefix: str) -> str:
@@ -1138,31 +1144,764 @@ def create_filename(file_prefix: str) -> str:
     return f"{DEST_BUCKET_NAME}/{file_prefix}-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.parquet"
 
 
-def process_section(records: list[dict[str, Any]],
+def create_dirname(file_prefix: str) -> str:
+    """Creates a directory name for a partitioned dataset.
+
+    @param file_prefix: The prefix to use for the directory name.
+    @return: The directory name.
+    """
+    return f"{DEST_BUCKET_NAME}/{file_prefix}-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+
+
+@dataclass(frozen=True)
+class ParquetWriterOptions:
+    """Options for writing section results to Parquet.
+
+    @ivar row_group_size: The maximum number of rows per row group, also the
+        number of rows fetched from DuckDB per record batch.
+    @ivar compression: The compression codec, e.g. snappy, zstd or none.
+    @ivar use_dictionary: Whether to dictionary encode the columns.
+    @ivar sort_by_id: Whether to sort the rows by norskIdentifikator/id and
+        felt, so the row group min/max statistics let readers skip all but a
+        few row groups when looking up one id.
+    """
+    row_group_size: int = 1 << 20
+    compression: str = "snappy"
+    use_dictionary: bool = True
+    sort_by_id: bool = False
+
+
+# the writer options used unless others are given
+DEFAULT_WRITER_OPTIONS = ParquetWriterOptions()
+
+# sorted output with small row groups, for readers filtering on one norskIdentifikator
+ID_LOOKUP_WRITER_OPTIONS = ParquetWriterOptions(row_group_size=LOOKUP_ROW_GROUP_SIZE, sort_by_id=True)
+
+
+def order_by_id(relation: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    """Orders a section result by its identifier and felt.
+
+    Sections with a norskIdentifikator column are ordered by it, since the id
+    column of the skogbruk sections is the skogOgToemmerkonto id.
+
+    @param relation: The DuckDB relation to order.
+    @return: The ordered relation, or the relation itself if it has neither column.
+    """
+    id_column = "norskIdentifikator" if "norskIdentifikator" in relation.columns else "id"
+    order_columns = [column for column in (id_column, "felt") if column in relation.columns]
+    if not order_columns:
+        return relation
+
+    return relation.order(", ".join(f'"{column}"' for column in order_columns))
+
+
+def split_write_stage(write_stage: StageMetrics,
+                      query_stage: StageMetrics | None,
+                      upload_stage: StageMetrics | None,
+                      num_rows: int,
+                      bytes_written: int) -> None:
+    """Splits the time of a section write into its query and upload stages.
+
+    DuckDB runs the query as the batches are fetched, inside the write, so the
+    upload stage gets the write time not spent fetching batches.
+
+    @param write_stage: The stage timing the whole write.
+    @param query_stage: The stage timing the batch fetches during the write, if any.
+    @param upload_stage: The stage to fill in, if any.
+    @param num_rows: The number of rows written.
+    @param bytes_written: The number of bytes written.
+    """
+    if query_stage is not None:
+        query_stage.rows_out = num_rows
+    if upload_stage is not None:
+        upload_stage.wall_seconds += write_stage.wall_seconds - (query_stage.wall_seconds if query_stage else 0.0)
+        upload_stage.process_cpu_seconds += (write_stage.process_cpu_seconds
+                                             - (query_stage.process_cpu_seconds if query_stage else 0.0))
+        upload_stage.process_peak_rss_bytes = max(upload_stage.process_peak_rss_bytes,
+                                                  write_stage.process_peak_rss_bytes)
+        upload_stage.rows_in = upload_stage.rows_out = num_rows
+        upload_stage.bytes_written = bytes_written
+
+
+def write_parquet(relation: duckdb.DuckDBPyRelation,
+                  destination_filename: str,
+                  writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+                  query_stage: StageMetrics | None = None,
+                  upload_stage: StageMetrics | None = None) -> int:
+    """Streams a DuckDB result as Arrow record batches into a Parquet file.
+
+    @param relation: The DuckDB relation to write.
+    @param destination_filename: The Google Cloud Storage path to write to.
+    @param writer_options: The Parquet writer options.
+    @param query_stage: The stage timing the query producing the batches, if any.
+    @param upload_stage: The stage timing the encoding and writing of the batches, if any.
+    @return: The number of rows written.
+    """
+    if writer_options.sort_by_id:
+        relation = order_by_id(relation)
+
+    write_stage = StageMetrics("write")
+    num_rows = 0
+
+    with timed(write_stage), storage.get_file_system().open(path=destination_filename, mode="wb") as parquet_file:
+        with timed(query_stage):
+            reader = relation.fetch_arrow_reader(batch_size=writer_options.row_group_size)
+
+        with pq.ParquetWriter(parquet_file,
+                              reader.schema,
+                              compression=writer_options.compression,
+                              use_dictionary=writer_options.use_dictionary) as writer:
+            while True:
+                with timed(query_stage):
+                    record_batch = next(reader, None)
+                if record_batch is None:
+                    break
+                writer.write_batch(record_batch, row_group_size=writer_options.row_group_size)
+                num_rows += record_batch.num_rows
+        bytes_written = parquet_file.tell()
+
+    split_write_stage(write_stage, query_stage, upload_stage, num_rows, bytes_written)
+    return num_rows
+
+
+def write_partitioned_parquet(relation: duckdb.DuckDBPyRelation,
+                              destination_dirname: str,
+                              partition_cols: list[str],
+                              writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+                              query_stage: StageMetrics | None = None,
+                              upload_stage: StageMetrics | None = None) -> int:
+    """Streams a DuckDB result into a Hive-partitioned Parquet dataset.
+
+    The partition columns are stored in the directory names only, e.g.
+    inntektsaar=2023/hovedtema=resultatregnskap/undertema=driftsinntekt.
+
+    @param relation: The DuckDB relation to write.
+    @param destination_dirname: The Google Cloud Storage directory to write to.
+    @param partition_cols: The columns to partition on, in directory order.
+    @param writer_options: The Parquet writer options.
+    @param query_stage: The stage timing the query producing the batches, if any.
+    @param upload_stage: The stage timing the encoding and writing of the batches, if any.
+    @return: The number of rows written.
+    """
+    written_files: list[pa_ds.WrittenFile] = []
+    parquet_format = pa_ds.ParquetFileFormat()
+
+    if writer_options.sort_by_id:
+        relation = order_by_id(relation)
+
+    write_stage = StageMetrics("write")
+
+    def timed_batches(reader: pa.RecordBatchReader) -> Iterator[pa.RecordBatch]:
+        while True:
+            with timed(query_stage):
+                record_batch = next(reader, None)
+            if record_batch is None:
+                return
+            yield record_batch
+
+    with timed(write_stage):
+        with timed(query_stage):
+            reader = relation.fetch_arrow_reader(batch_size=writer_options.row_group_size)
+
+        pa_ds.write_dataset(
+            pa.RecordBatchReader.from_batches(reader.schema, timed_batches(reader)),
+            base_dir=destination_dirname,
+            filesystem=pa_fs.PyFileSystem(pa_fs.FSSpecHandler(storage.get_file_system())),
+            format=parquet_format,
+            file_options=parquet_format.make_write_options(compression=writer_options.compression,
+                                                           use_dictionary=writer_options.use_dictionary),
+            partitioning=partition_cols,
+            partitioning_flavor="hive",
+            basename_template="part-{i}.parquet",
+            max_rows_per_group=writer_options.row_group_size,
+            existing_data_behavior="overwrite_or_ignore",
+            preserve_order=writer_options.sort_by_id,
+            file_visitor=written_files.append,
+        )
+
+    num_rows = sum(written_file.metadata.num_rows for written_file in written_files)
+    split_write_stage(write_stage, query_stage, upload_stage, num_rows,
+                      sum(written_file.size for written_file in written_files))
+    return num_rows
+
+
+def fingerprint_source_file(source_file: str) -> str:
+    """Fingerprints the content of a source file.
+
+    Uses the MD5 hash stored by Google Cloud Storage when available, so the
+    file doesn't have to be read, and otherwise hashes the file content.
+
+    @param source_file: The Google Cloud Storage path of the file.
+    @return: The fingerprint.
+    """
+    fs = storage.get_file_system()
+    md5_hash = fs.info(source_file).get("md5Hash")
+    if md5_hash:
+        return f"md5:{md5_hash}"
+
+    sha256 = hashlib.sha256()
+    with fs.open(path=source_file, mode="rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return f"sha256:{sha256.hexdigest()}"
+
+
+class SectionCache:
+    """Content-addressed cache of section results in Google Cloud Storage.
+
+    A result is keyed on the source file fingerprint, the section SQL, the
+    writer options and PIPELINE_VERSION, and stored as {key}.parquet. The
+    index of sizes and last use is shared by the worker threads and saved by
+    save(); concurrent runs sharing a cache may lose each other's index
+    updates, which only costs recomputation.
+    """
+
+    def __init__(self,
+                 source_fingerprint: str,
+                 cache_dirname: str = SECTION_CACHE_DIRNAME,
+                 max_bytes: int = SECTION_CACHE_MAX_BYTES) -> None:
+        """Loads the cache index.
+
+        @param source_fingerprint: The fingerprint of the source file, see fingerprint_source_file.
+        @param cache_dirname: The Google Cloud Storage directory of the cache.
+        @param max_bytes: The size limit of the cache.
+        """
+        self.fs = storage.get_file_system()
+        self.source_fingerprint = source_fingerprint
+        self.cache_dirname = cache_dirname
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self._index_filename = f"{cache_dirname}/index.json"
+        self._entries: dict[str, dict[str, Any]] = {}
+        if self.fs.exists(self._index_filename):
+            with self.fs.open(path=self._index_filename, mode="r") as index_file:
+                self._entries = json.load(index_file)["entries"]
+
+    def key(self, duckdb_sql: str, *key_parts: Any) -> str:
+        """Creates the cache key of a section result.
+
+        @param duckdb_sql: The section SQL.
+        @param key_parts: Anything else the result depends on, e.g. the writer options.
+        @return: The key.
+        """
+        key_text = "\0".join([self.source_fingerprint, duckdb_sql, PIPELINE_VERSION, *map(repr, key_parts)])
+        return hashlib.sha256(key_text.encode("utf-8")).hexdigest()
+
+    def _object_filename(self, key: str) -> str:
+        return f"{self.cache_dirname}/{key}.parquet"
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def fetch(self, key: str, destination_filename: str) -> bool:
+        """Copies a cached result to the destination, if cached.
+
+        @param key: The cache key.
+        @param destination_filename: The Google Cloud Storage path to copy to.
+        @return: Whether the result was cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+
+        if entry is None:
+            logging.info("Section cache miss for %s", destination_filename)
+            return False
+
+        try:
+            self.fs.copy(self._object_filename(key), destination_filename)
+        except FileNotFoundError:
+            logging.info("Section cache miss for %s, cached result was removed", destination_filename)
+            with self._lock:
+                self._entries.pop(key, None)
+            return False
+
+        logging.info("Section cache hit for %s", destination_filename)
+        return True
+
+    def store(self, key: str, filename: str) -> None:
+        """Stores a written result and evicts the least recently used results beyond the size limit.
+
+        @param key: The cache key.
+        @param filename: The Google Cloud Storage path of the written result.
+        """
+        self.fs.copy(filename, self._object_filename(key))
+        with self._lock:
+            self._entries[key] = {"size": self.fs.size(filename), "last_used": time.time()}
+            self._evict()
+
+    def _evict(self) -> None:
+        total_bytes = sum(entry["size"] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda entry_key: self._entries[entry_key]["last_used"]):
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= self._entries.pop(key)["size"]
+            try:
+                self.fs.rm(self._object_filename(key))
+            except FileNotFoundError:
+                pass
+            logging.info("Evicted %s from the section cache", key)
+
+    def save(self) -> None:
+        """Saves the cache index."""
+        with self._lock:
+            index = {"entries": dict(self._entries)}
+        with self.fs.open(path=self._index_filename, mode="w") as index_file:
+            json.dump(index, index_file)
+
+
+class SectionSession:
+    """Keeps the naeringsspesifikasjon data resident in one DuckDB connection.
+
+    The records are converted to Arrow once and registered as ``arrow_table``,
+    so every section SQL runs against the same table instead of converting
+    the whole delivery again.
+    """
+
+    def __init__(self,
+                 arrow_data: pa.Table | pa.RecordBatchReader,
+                 database: str = ":memory:",
+                 metrics: RunMetrics | None = None,
+                 profile: bool = False) -> None:
+        """Makes the Arrow data available as arrow_table in a new DuckDB connection.
+
+        An Arrow table is registered as is. A record batch stream is consumed
+        once into a DuckDB table, which is stored compressed and can spill to
+        disk, so the whole delivery never has to fit in memory as Arrow.
+
+        @param arrow_data: The naeringsspesifikasjon data as an Arrow table or stream.
+        @param database: The DuckDB database, a file path lets large streams live on disk.
+        @param metrics: The run metrics to add the stages of the session to, a new one if None.
+        @param profile: Whether to save the DuckDB query profile of every section, see profiled.
+        """
+        self.connection = duckdb.connect(database)
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.profile = profile
+        self._owner_thread_id = threading.get_ident()
+        self._thread_local = threading.local()
+        self._cursors: list[duckdb.DuckDBPyConnection] = []
+        self._cursors_lock = threading.Lock()
+        self.num_latest: int | None = None
+        self.num_flattened: int | None = None
+
+        # a stream is decoded while DuckDB reads it, so the load includes the decode stages
+        load_stage = self.metrics.stage("duckdb load")
+        with timed(load_stage):
+            if isinstance(arrow_data, pa.RecordBatchReader):
+                self.connection.register("arrow_stream", arrow_data)
+                self.connection.execute("CREATE OR REPLACE TABLE arrow_table AS SELECT * FROM arrow_stream")
+                self.connection.unregister("arrow_stream")
+            else:
+                self.connection.register("arrow_table", arrow_data)
+
+            self.num_rows: int = self.connection.sql("SELECT COUNT(*) FROM arrow_table").fetchone()[0]
+        load_stage.rows_out = self.num_rows
+        logging.info("Number of records in arrow_table: %d", self.num_rows)
+
+        self.deduplicate()
+
+    def deduplicate(self) -> None:
+        """Creates the latest_naeringsspesifikasjon table read by every section.
+
+        The latest submission per norskIdentifikator and inntektsaar is picked
+        once here, so the sections don't each sort the whole delivery.
+        """
+        deduplicate_stage = self.metrics.stage("deduplicate", rows_in=self.num_rows)
+        with timed(deduplicate_stage), self.profiled(create_dirname("latest-naeringsspesifikasjon")):
+            self.connection.execute(LATEST_NAERINGSSPESIFIKASJON_SQL)
+
+        submissions, latest = self.connection.sql("""
+            SELECT
+                (SELECT COUNT(*)
+                 FROM arrow_table
+                 WHERE naeringsspesifikasjon.norskIdentifikator IS NOT NULL
+                   AND naeringsspesifikasjon.inntektsaar IS NOT NULL),
+                (SELECT COUNT(*) FROM latest_naeringsspesifikasjon)
+        """).fetchone()
+        deduplicate_stage.rows_out = self.num_latest = latest
+        logging.info("Kept %d latest submissions, dropped %d superseded submissions",
+                     latest, submissions - latest)
+
+    @classmethod
+    def from_records(cls,
+                     records: list[dict[str, Any]],
+                     metrics: RunMetrics | None = None,
+                     profile: bool = False) -> "SectionSession":
+        """Creates a session by converting the records to Arrow once.
+
+        @param records: The records as returned by read_avro_into_records.
+        @param metrics: The run metrics to add the stages of the session to, a new one if None.
+        @param profile: Whether to save the DuckDB query profile of every section.
+        @return: The session.
+        """
+        metrics = metrics if metrics is not None else RunMetrics()
+        conversion_stage = metrics.stage("arrow conversion", rows_in=len(records))
+        with timed(conversion_stage):
+            arrow_table = pa.Table.from_pylist(records)
+        conversion_stage.rows_out = arrow_table.num_rows
+
+        return cls(arrow_table, metrics=metrics, profile=profile)
+
+    @classmethod
+    def from_source_files(cls,
+                          source_files: list[str],
+                          schema: pa.Schema,
+                          snapshot_filename: str | None = None,
+                          database: str = ":memory:",
+                          metrics: RunMetrics | None = None,
+                          profile: bool = False) -> "SectionSession":
+        """Creates a session by streaming Avro files and an earlier snapshot.
+
+        @param source_files: The Google Cloud Storage Avro files to read.
+        @param schema: The Arrow schema of the records, see read_naering_arrow_schema.
+        @param snapshot_filename: A Parquet snapshot of earlier submissions to merge, if it exists.
+        @param database: The DuckDB database to hold the data.
+        @param metrics: The run metrics to add the stages of the session to, a new one if None.
+        @param profile: Whether to save the DuckDB query profile of every section.
+        @return: The session.
+        """
+        metrics = metrics if metrics is not None else RunMetrics()
+        batch_reader = pa.RecordBatchReader.from_batches(
+            schema, iter_source_record_batches(source_files,
+                                               schema=schema,
+                                               snapshot_filename=snapshot_filename,
+                                               metrics=metrics)
+        )
+        return cls(batch_reader, database=database, metrics=metrics, profile=profile)
+
+    @classmethod
+    def from_avro_stream(cls,
+                         avro_file: BinaryIO,
+                         schema: pa.Schema,
+                         database: str = ":memory:",
+                         metrics: RunMetrics | None = None,
+                         profile: bool = False) -> "SectionSession":
+        """Creates a session by streaming the Avro file in record batches.
+
+        @param avro_file: The Avro file, opened for reading.
+        @param schema: The Arrow schema of the records, see read_naering_arrow_schema.
+        @param database: The DuckDB database to hold the data.
+        @param metrics: The run metrics to add the stages of the session to, a new one if None.
+        @param profile: Whether to save the DuckDB query profile of every section.
+        @return: The session.
+        """
+        metrics = metrics if metrics is not None else RunMetrics()
+        batch_reader = pa.RecordBatchReader.from_batches(
+            schema, iter_avro_record_batches(avro_file, schema=schema, metrics=metrics)
+        )
+        return cls(batch_reader, database=database, metrics=metrics, profile=profile)
+
+    def flatten(self) -> None:
+        """Unnests every felt/beloep array once into the naering_langt table."""
+        flatten_stage = self.metrics.stage("flatten", rows_in=self.num_latest)
+        with timed(flatten_stage):
+            with self.profiled(create_dirname("naering-langt")):
+                self.connection.execute(FLATTENED_SQL)
+            self.num_flattened = self.connection.sql("SELECT COUNT(*) FROM naering_langt").fetchone()[0]
+        flatten_stage.rows_out = self.num_flattened
+        logging.info("Flattened %d values into naering_langt in %.3g seconds",
+                     self.num_flattened,
+                     flatten_stage.wall_seconds)
+
+    def input_rows(self, duckdb_sql: str) -> int | None:
+        """The number of rows in the session table a section SQL reads.
+
+        @param duckdb_sql: The section SQL.
+        @return: The rows of naering_langt, latest_naeringsspesifikasjon or arrow_table, whichever
+            the SQL reads, in that order, or None if it reads none of them.
+        """
+        for table_name, num_rows in (("naering_langt", self.num_flattened),
+                                     ("latest_naeringsspesifikasjon", self.num_latest),
+                                     ("arrow_table", self.num_rows)):
+            if table_name in duckdb_sql:
+                return num_rows
+        return None
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Returns the DuckDB connection to use from the current thread.
+
+        The thread that created the session uses the connection itself, other
+        threads get one cursor each on the shared database. Cursors see the
+        tables of the session, but not the registered arrow_table view.
+
+        @return: The connection or cursor.
+        """
+        if threading.get_ident() == self._owner_thread_id:
+            return self.connection
+
+        cursor = getattr(self._thread_local, "cursor", None)
+        if cursor is None:
+            cursor = self.connection.cursor()
+            self._thread_local.cursor = cursor
+            with self._cursors_lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    @contextmanager
+    def profiled(self, output_name: str) -> Iterator[None]:
+        """Saves the DuckDB profile of the last query run in the with block on this thread.
+
+        Does nothing unless the session was created with profile=True. The
+        operator-level JSON profile is written next to the output, as
+        <output_name>.profile.json without any .parquet suffix, and can be
+        summed up with 3. speed testing/summarize_profiles.py.
+
+        @param output_name: The Google Cloud Storage filename or dirname of the output of the query.
+        """
+        if not self.profile:
+            yield
+            return
+
+        cursor = self.cursor()
+        profile_filename = f"{output_name.removesuffix('.parquet')}.profile.json"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profile_path = Path(temp_dir) / "profile.json"
+            cursor.execute("PRAGMA enable_profiling = 'json'")
+            cursor.execute(f"PRAGMA profiling_output = '{profile_path}'")
+            try:
+                yield
+            finally:
+                cursor.execute("PRAGMA disable_profiling")
+
+            with storage.get_file_system().open(path=profile_filename, mode="wb") as profile_file:
+                profile_file.write(profile_path.read_bytes())
+        logging.info("Wrote DuckDB query profile to %s", profile_filename)
+
+    def sql(self, duckdb_sql: str) -> duckdb.DuckDBPyRelation:
+        """Runs a section SQL against the session data.
+
+        @param duckdb_sql: The SQL to run.
+        @return: The DuckDB relation.
+        """
+        return self.cursor().sql(duckdb_sql)
+
+    def close(self) -> None:
+        for cursor in self._cursors:
+            cursor.close()
+        self.connection.close()
+
+    def __enter__(self) -> "SectionSession":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def section_stages(session: SectionSession,
+                   duckdb_sql: str,
+                   file_prefix: str) -> tuple[StageMetrics, StageMetrics]:
+    """Adds the query and upload stages of a section to the session metrics.
+
+    @param session: The session the section is processed in.
+    @param duckdb_sql: The section SQL.
+    @param file_prefix: The prefix of the section filename, naming the stages.
+    @return: The query stage and the upload stage.
+    """
+    return (session.metrics.stage(f"{file_prefix} query", rows_in=session.input_rows(duckdb_sql)),
+            session.metrics.stage(f"{file_prefix} upload"))
+
+
+def process_section(session: SectionSession,
                     duckdb_sql: str,
-                    file_prefix: str) -> str:
+                    file_prefix: str,
+                    writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+                    partition_cols: list[str] | None = None,
+                    cache: SectionCache | None = None) -> str:
     """Processes the section data.
 
-    @param records: The data to process.
+    @param session: The session holding the data to process.
     @param duckdb_sql: The SQL to use for processing the data.
     @param file_prefix: The prefix to use for the filename.
-    @return: The destination filename.
+    @param writer_options: The Parquet writer options.
+    @param partition_cols: The columns to partition on, writes a single file if None.
+    @param cache: The cache to reuse single-file results from, if any.
+    @return: The destination filename or dirname.
     """
-    arrow_table = pa.Table.from_pylist(records)
-    logging.info("Number of records in arrow_table: %d", arrow_table.num_rows)
-    result_df = duckdb.sql(duckdb_sql).to_df()
-
-    destination_filename = create_filename(file_prefix)
-    dp.write_pandas(
-        df=result_df,
-        gcs_path=destination_filename,
-        file_format="parquet"
-    )
-    logging.info("Wrote Parquet file with %d records to %s",
-                 result_df.shape[0], destination_filename)
+    if partition_cols:
+        destination_filename = create_dirname(file_prefix)
+        with session.profiled(destination_filename):
+            num_rows = write_partitioned_parquet(session.sql(duckdb_sql),
+                                                 destination_filename,
+                                                 partition_cols,
+                                                 writer_options,
+                                                 *section_stages(session, duckdb_sql, file_prefix))
+        logging.info("Wrote partitioned Parquet dataset with %d records to %s",
+                     num_rows, destination_filename)
+    else:
+        destination_filename = create_filename(file_prefix)
+        cache_key = cache.key(duckdb_sql, writer_options) if cache is not None else None
+        if cache is not None:
+            with timed(session.metrics.stage(f"{file_prefix} cache")):
+                fetched = cache.fetch(cache_key, destination_filename)
+            if fetched:
+                return destination_filename
+
+        with session.profiled(destination_filename):
+            num_rows = write_parquet(session.sql(duckdb_sql),
+                                     destination_filename,
+                                     writer_options,
+                                     *section_stages(session, duckdb_sql, file_prefix))
+        logging.info("Wrote Parquet file with %d records to %s",
+                     num_rows, destination_filename)
+        if cache is not None:
+            cache.store(cache_key, destination_filename)
+
+    return destination_filename
+
+
+def process_sections(session: SectionSession,
+                     sections: list[tuple[str, str]],
+                     max_workers: int = SECTION_WORKERS,
+                     writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+                     partitioning: dict[str, list[str]] | None = None,
+                     cache: SectionCache | None = None) -> dict[str, str]:
+    """Processes independent sections concurrently.
+
+    Each worker thread runs its section queries and Parquet writes on its own
+    DuckDB cursor. A failing section is logged and does not stop the others.
+
+    @param session: The session holding the data to process.
+    @param sections: The sections to process, as (file prefix, section SQL).
+    @param max_workers: The number of sections to process at the same time.
+    @param writer_options: The Parquet writer options.
+    @param partitioning: The partition columns per file prefix of the sections
+        written as partitioned datasets.
+    @param cache: The cache to reuse single-file results from, if any.
+    @return: The destination filename per file prefix.
+    @raise RuntimeError: If any of the sections failed.
+    """
+    destination_filenames: dict[str, str] = {}
+    failed_sections: list[str] = []
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="section") as executor:
+        futures = {
+            executor.submit(process_section,
+                            session=session,
+                            duckdb_sql=duckdb_sql,
+                            file_prefix=file_prefix,
+                            writer_options=writer_options,
+                            partition_cols=(partitioning or {}).get(file_prefix),
+                            cache=cache): file_prefix
+            for file_prefix, duckdb_sql in sections
+        }
+        for future in as_completed(futures):
+            file_prefix = futures[future]
+            try:
+                destination_filenames[file_prefix] = future.result()
+            except Exception:
+                logging.exception("Failed to process section %s", file_prefix)
+                failed_sections.append(file_prefix)
+
+    if failed_sections:
+        raise RuntimeError(f"Failed to process sections: {', '.join(sorted(failed_sections))}")
+
+    return destination_filenames
+
+
+def write_changes(session: SectionSession,
+                  long_snapshot_filename: str = LONG_SNAPSHOT_FILENAME,
+                  writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS) -> str:
+    """Writes the values changed since the previous run and replaces the long snapshot.
+
+    Compares naering_langt with the snapshot of the previous run and writes
+    the inserted, changed and superseded values with their sekvensnummer, so
+    the editing software can apply deltas. Every value is inserted on the
+    first run. Expects session.flatten() to have been called.
+
+    @param session: The session holding the data to process.
+    @param long_snapshot_filename: The Google Cloud Storage Parquet snapshot of naering_langt.
+    @param writer_options: The Parquet writer options.
+    @return: The destination filename of the changes.
+    """
+    fs = storage.get_file_system()
+    if fs.exists(long_snapshot_filename):
+        with fs.open(path=long_snapshot_filename, mode="rb") as snapshot_file:
+            session.connection.register("previous_naering_langt", pq.read_table(snapshot_file))
+    else:
+        logging.info("No previous snapshot %s, every value is inserted", long_snapshot_filename)
+        session.connection.execute("CREATE OR REPLACE TEMP VIEW previous_naering_langt AS "
+                                   "SELECT * FROM naering_langt LIMIT 0")
+
+    destination_filename = create_filename("endringer")
+    with session.profiled(destination_filename):
+        num_changes = write_parquet(session.sql(CHANGES_SQL),
+                                    destination_filename,
+                                    writer_options,
+                                    *section_stages(session, CHANGES_SQL, "endringer"))
+    logging.info("Wrote Parquet file with %d changed values to %s",
+                 num_changes, destination_filename)
+
+    snapshot_sql = "SELECT * FROM naering_langt"
+    write_parquet(session.sql(snapshot_sql),
+                  long_snapshot_filename,
+                  writer_options,
+                  *section_stages(session, snapshot_sql, "naering-langt-snapshot"))
     return destination_filename
 
-def main(source_file: str) -> None:
+
+def write_sections(session: SectionSession,
+                   max_workers: int = SECTION_WORKERS,
+                   one_scan: bool = True,
+                   writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+                   partitioned: bool = False,
+                   changes: bool = False,
+                   cache: SectionCache | None = None,
+                   wide: bool = False) -> dict[str, str]:
+    """Writes every section of the session, see main for the options.
+
+    @param session: The session holding the data to process.
+    @param max_workers: The number of sections to process at the same time.
+    @param one_scan: Whether to write the sections as projections of naering_langt.
+    @param writer_options: The Parquet writer options.
+    @param partitioned: Whether to write naering and balanseregnskap as partitioned datasets.
+    @param changes: Whether to write the values changed since the previous run.
+    @param cache: The cache to reuse single-file results from, if any.
+    @param wide: Whether to also write the wide naering-bredt table.
+    @return: The destination filename per file prefix.
+    """
+    sections = ONE_SCAN_SECTIONS if one_scan else SECTIONS
+    if one_scan or partitioned or changes or wide:
+        session.flatten()
+    if wide:
+        unknown_post_types = [row[0] for row in session.sql(UNKNOWN_POST_TYPES_SQL).fetchall()]
+        if unknown_post_types:
+            logging.warning("Post types without a column in naering-bredt, add them to POST_TYPES: %s",
+                            ", ".join(unknown_post_types))
+        sections = sections + [("naering-bredt", WIDE_SQL)]
+    if partitioned:
+        sections = [(file_prefix, PARTITIONED_SECTIONS.get(file_prefix, duckdb_sql))
+                    for file_prefix, duckdb_sql in sections]
+
+    destination_filenames = process_sections(
+        session=session,
+        sections=sections,
+        max_workers=max_workers,
+        writer_options=writer_options,
+        partitioning=({file_prefix: PARTITION_COLUMNS for file_prefix in PARTITIONED_SECTIONS}
+                      if partitioned else None),
+        cache=cache
+    )
+
+    if changes:
+        destination_filenames["endringer"] = write_changes(session, writer_options=writer_options)
+
+    return destination_filenames
+
+
+def main(source_file: str,
+         streaming: bool = False,
+         max_workers: int = SECTION_WORKERS,
+         one_scan: bool = True,
+         writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+         partitioned: bool = False,
+         changes: bool = False,
+         wide: bool = False,
+         cache: bool = False,
+         cache_max_bytes: int = SECTION_CACHE_MAX_BYTES,
+         profile: bool = False) -> None:
     """
     Function for processing kildedata to inndata.
     Function takes kilde-bucket path as input and processes data, writing inndata
@@ -1172,149 +1911,216 @@ def main(source_file: str) -> None:
     ----------
     source_file: str
         Google Cloud Storage filepath in kilde-bucket.
+    streaming: bool
+        Decode the Avro file in bounded record batches instead of reading the
+        whole delivery into a list of dicts. Keeps peak memory low on small nodes.
+    max_workers: int
+        Number of sections queried and written concurrently.
+    one_scan: bool
+        Unnest every array and sum in SECTION_REGISTRY in one fused scan into
+        naering_langt and write the sections as filtered projections of it.
+        If False, each section unnests its own arrays again.
+    writer_options: ParquetWriterOptions
+        Row group size, compression codec, dictionary encoding and sorting of
+        the Parquet files written. Use ID_LOOKUP_WRITER_OPTIONS for output
+        that is mostly read one norskIdentifikator at a time.
+    partitioned: bool
+        Write the long naering and balanseregnskap sections as datasets
+        partitioned on inntektsaar, hovedtema and undertema, so readers can
+        prune partitions. Flattens into naering_langt as with one_scan.
+    changes: bool
+        Also write the (inntektsaar, id, felt) values inserted, changed or
+        superseded since the previous run, with their sekvensnummer, and keep
+        naering_langt as the snapshot for the next run.
+    wide: bool
+        Also write naering-bredt, one row per norskIdentifikator and
+        inntektsaar with a float64 p<type> column for every post in POST_TYPES
+        and a column for every sum, NULL where there is no value.
+    cache: bool
+        Reuse the single-file outputs of an earlier run on the same source
+        file content, SQL, writer options and PIPELINE_VERSION from the section
+        cache instead of recomputing them. The source file is not read at all
+        when every output is cached.
+    cache_max_bytes: int
+        Size limit of the section cache, least recently used results beyond
+        it are evicted.
+    profile: bool
+        Save the operator-level DuckDB profile of every section query, and of
+        the deduplication and flattening, as <output>.profile.json next to
+        the output. Rank them with 3. speed testing/summarize_profiles.py.
+
+    The wall time, CPU time, rows, bytes written and peak memory of every
+    stage are written as one JSON summary, metrikker-<timestamp>.json.
     """
     start_time = timeit.default_timer()
-
-    with (dp.FileClient.get_gcs_file_system().open(path=source_file, mode="rb") as avro_file):
-        naering_records = read_avro_into_records(avro_content=BytesIO(avro_file.read()))
+    metrics = RunMetrics()
+    run_info = {
+        "source_file": source_file,
+        "options": {"streaming": streaming, "max_workers": max_workers, "one_scan": one_scan,
+                    "writer_options": asdict(writer_options), "partitioned": partitioned,
+                    "changes": changes, "wide": wide, "cache": cache, "profile": profile},
+    }
+
+    section_cache = None
+    if cache:
+        section_cache = SectionCache(fingerprint_source_file(source_file), max_bytes=cache_max_bytes)
+        original_structure_key = section_cache.key(ORIGINAL_STRUCTURE_SQL, writer_options, streaming)
+        cached_sections = (ONE_SCAN_SECTIONS if one_scan else SECTIONS) + ([("naering-bredt", WIDE_SQL)]
+                                                                          if wide else [])
+        section_keys = {file_prefix: section_cache.key(duckdb_sql, writer_options)
+                        for file_prefix, duckdb_sql in cached_sections}
+
+        if not (partitioned or changes) and all(section_cache.contains(key)
+                                                for key in [original_structure_key, *section_keys.values()]):
+            with timed(metrics.stage("cache")):
+                fetched = [section_cache.fetch(original_structure_key, create_filename("opprinnelig-struktur"))]
+                fetched.extend(section_cache.fetch(key, create_filename(file_prefix))
+                               for file_prefix, key in section_keys.items())
+                section_cache.save()
+            if all(fetched):
+                logging.info("Completed copying every cached output of %s in %.3g seconds",
+                             source_file,
+                             timeit.default_timer() - start_time)
+                metrics.write(f"{create_dirname('metrikker')}.json", **run_info)
+                return None
+
+    with (storage.get_file_system().open(path=source_file, mode="rb") as avro_file):
+        if streaming:
+            session = SectionSession.from_avro_stream(avro_file,
+                                                      schema=read_naering_arrow_schema(),
+                                                      metrics=metrics,
+                                                      profile=profile)
+        else:
+            download_stage = metrics.stage("download")
+            with timed(download_stage):
+                avro_content = avro_file.read()
+            naering_records = read_avro_into_records(avro_content=BytesIO(avro_content), metrics=metrics)
+            session = SectionSession.from_records(naering_records, metrics=metrics, profile=profile)
 
         logging.info("Completed reading %s into records in %.3g seconds",
                      source_file,
                      timeit.default_timer() - start_time)
 
-        if len(naering_records) < 1:
+        if session.num_rows < 1:
             logging.warning("No records found for original")
+            session.close()
             return None
 
         # write records with original structure to Parquet
-        dp.write_pandas(
-            df=pd.DataFrame.from_records(naering_records),
-            gcs_path=create_filename("opprinnelig-struktur"),
-            file_format="parquet"
-        )
+        original_structure_filename = create_filename("opprinnelig-struktur")
+        if section_cache is None or not section_cache.fetch(original_structure_key, original_structure_filename):
+            write_parquet(session.sql(ORIGINAL_STRUCTURE_SQL),
+                          original_structure_filename,
+                          writer_options,
+                          *section_stages(session, ORIGINAL_STRUCTURE_SQL, "opprinnelig-struktur"))
+            if section_cache is not None:
+                section_cache.store(original_structure_key, original_structure_filename)
 
         #
         # process the sections
         #
 
-        process_section(
-            records=naering_records,
-            duckdb_sql=SKOG_OG_TOEMMERKONTO_SQL,
-            file_prefix="skogbruk-skog-og-toemmerkonto"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=SKOGFOND_SQL,
-            file_prefix="skogbruk-skogfond"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=SKATT_NAERING_SQL,
-            file_prefix="naering"
-        )
-        
-        process_section(
-            records=naering_records,
-            duckdb_sql=DRIFTSINNTEKT_SQL,
-            file_prefix="driftsinntekt"
-        )
-        
-        process_section(
-            records=naering_records,
-            duckdb_sql=DRIFTSKOSTNAD_SQL,
-            file_prefix="driftskostnad"
-        )
-        
-        
-        process_section(
-            records=naering_records,
-            duckdb_sql=FINANSINNTEKT_SQL,
-            file_prefix="finansinntekt"
-        )
-        
-        process_section(
-            records=naering_records,
-            duckdb_sql=FINANSKOSTNAD_SQL,
-            file_prefix="finanskostnad"
-        )
-        
-        process_section(
-            records=naering_records,
-            duckdb_sql=SUM_RESULTATREGNSKAP_SQL,
-            file_prefix="sum_resultatregnskap"
-        )
-        
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=BALANSEREGNSKAP_SQL,
-            file_prefix="balanseregnskap"
-        )
-        
-        process_section(
-            records=naering_records,
-            duckdb_sql=SUM_BALANSERVERDI_FOR_ANLEGGSMIDDEL_SQL,
-            file_prefix="sum-balanseregnskap-anleggsmiddel"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=BALANSERVERDI_FOR_ANLEGGSMIDDEL_SQL,
-            file_prefix="balanseverdi-anleggsmiddel"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=SUM_BALANSERVERDI_FOR_OMLOEPSMIDDEL_SQL,
-            file_prefix="sum-balanseregnskap-omloepsmiddel"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=BALANSERVERDI_FOR_OMLOEPSMIDDEL_SQL,
-            file_prefix="balanseverdi-omloepsmiddel"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=SUM_LANGSIKTIGGJELD_SQL,
-            file_prefix="sum-langsiktig-gjeld"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=SUM_KORTSIKTIGGJELD_SQL,
-            file_prefix="sum-kortsiktig-gjeld"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=SUM_EGENKAPITAL_SQL,
-            file_prefix="sum-egenkapital"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=LANGSIKTIGGJELD_SQL,
-            file_prefix="langsiktig-gjeld"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=KORTSIKTIGGJELD_SQL,
-            file_prefix="kortsiktig-gjeld"
-        )
-
-        process_section(
-            records=naering_records,
-            duckdb_sql=EGENKAPITAL_SQL,
-            file_prefix="egenkapital"
-        )
+        with session:
+            try:
+                write_sections(session=session,
+                               max_workers=max_workers,
+                               one_scan=one_scan,
+                               writer_options=writer_options,
+                               partitioned=partitioned,
+                               changes=changes,
+                               wide=wide,
+                               cache=section_cache)
+            finally:
+                if section_cache is not None:
+                    section_cache.save()
 
     logging.info("Completed processing %s in %.3g seconds",
                  source_file,
                  timeit.default_timer() - start_time)
+    metrics.write(f"{create_dirname('metrikker')}.json", **run_info)
+
+
+def main_incremental(source_prefix: str,
+                     manifest_filename: str = MANIFEST_FILENAME,
+                     snapshot_filename: str = SNAPSHOT_FILENAME,
+                     max_workers: int = SECTION_WORKERS,
+                     one_scan: bool = True,
+                     writer_options: ParquetWriterOptions = DEFAULT_WRITER_OPTIONS,
+                     partitioned: bool = False,
+                     changes: bool = False,
+                     wide: bool = False,
+                     profile: bool = False) -> None:
+    """
+    Function for processing only the new kildedata files under a prefix.
+    Lists the Avro files under the prefix, skips the files recorded in the
+    manifest and merges the new submissions with the snapshot of the latest
+    submissions from earlier runs, latest registreringstidspunkt and
+    sekvensnummer winning. The sections are then written for the merged data,
+    and the snapshot and manifest are updated.
+
+    Parameters
+    ----------
+    source_prefix: str
+        Google Cloud Storage prefix in kilde-bucket, e.g. .../g2023/naeringsspesifikasjon_p2023_v1.avro
+    manifest_filename: str
+        Google Cloud Storage JSON file recording the source files already processed.
+    snapshot_filename: str
+        Google Cloud Storage Parquet file with the latest submission per
+        norskIdentifikator and inntektsaar in the original structure.
+    max_workers, one_scan, writer_options, partitioned, changes, wide, profile:
+        As for main.
+    """
+    start_time = timeit.default_timer()
+    metrics = RunMetrics()
+
+    manifest = read_manifest(manifest_filename)
+    processed_files = set(manifest["processed_files"])
+    source_files = sorted(
+        source_file
+        for source_file in storage.get_file_system().glob(f"{source_prefix.rstrip('/')}/*.avro")
+        if source_file not in processed_files
+    )
+    if not source_files:
+        logging.info("No new source files under %s", source_prefix)
+        return None
+
+    logging.info("Processing %d new source files under %s, %d already processed",
+                 len(source_files), source_prefix, len(processed_files))
+
+    with SectionSession.from_source_files(source_files,
+                                          schema=read_naering_arrow_schema(),
+                                          snapshot_filename=snapshot_filename,
+                                          metrics=metrics,
+                                          profile=profile) as session:
+        logging.info("Completed reading new source files and snapshot in %.3g seconds",
+                     timeit.default_timer() - start_time)
+
+        write_sections(session=session,
+                       max_workers=max_workers,
+                       one_scan=one_scan,
+                       writer_options=writer_options,
+                       partitioned=partitioned,
+                       changes=changes,
+                       wide=wide)
+
+        # the snapshot is only replaced once every section has been written
+        write_parquet(session.sql(LATEST_SUBMISSIONS_SQL),
+                      snapshot_filename,
+                      writer_options,
+                      *section_stages(session, LATEST_SUBMISSIONS_SQL, "latest-naeringsspesifikasjon"))
+
+    manifest["processed_files"] = sorted(processed_files.union(source_files))
+    write_manifest(manifest_filename, manifest)
+
+    logging.info("Completed processing %d new source files in %.3g seconds",
+                 len(source_files),
+                 timeit.default_timer() - start_time)
+    metrics.write(f"{create_dirname('metrikker')}.json",
+                  source_files=source_files,
+                  options={"max_workers": max_workers, "one_scan": one_scan,
+                           "writer_options": asdict(writer_options), "partitioned": partitioned,
+                           "changes": changes, "wide": wide, "profile": profile})
+
 
-main("gs://ssb-prod-skatt-naering-data-kilde/naeringsspesifikasjon_data/g2023/naeringsspesifikasjon_p2023_v1.avro/2024-04-18T10:35:24.628Z_9244_67451671_864877.avro")
+if __name__ == "__main__":
+    main("gs://ssb-prod-skatt-naering-data-kilde/naeringsspesifikasjon_data/g2023/naeringsspesifikasjon_p2023_v1.avro/2024-04-18T10:35:24.628Z_9244_67451671_864877.avro")
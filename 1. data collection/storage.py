@@ -0,0 +1,155 @@
+import logging
+import os
+import time
+from pathlib import Path
+
+import fsspec
+from fsspec.implementations.dirfs import DirFileSystem
+from fsspec.implementations.local import LocalFileOpener, LocalFileSystem
+from fsspec.implementations.memory import MemoryFileSystem
+
+# the storage backend, one of STORAGE_BACKENDS
+STORAGE_BACKEND_VARIABLE = "NAERING_STORAGE"
+
+# the directory the local and simulated backends keep the gs:// buckets in
+STORAGE_ROOT_VARIABLE = "NAERING_STORAGE_ROOT"
+
+# the simulated backend's latency per request in seconds and throughput per open file in MB/s
+STORAGE_LATENCY_VARIABLE = "NAERING_STORAGE_LATENCY"
+STORAGE_THROUGHPUT_VARIABLE = "NAERING_STORAGE_THROUGHPUT"
+
+STORAGE_BACKENDS = ("gcs", "local", "memory", "simulated")
+
+DEFAULT_STORAGE_ROOT = Path(__file__).resolve().parent / "local-storage"
+
+# roughly what a single GCS stream gets from a Dapla Jupyter server
+DEFAULT_LATENCY = 0.05
+DEFAULT_THROUGHPUT = 50.0
+
+
+class GcsPathFileSystem(DirFileSystem):
+    """Wraps a filesystem so gs://bucket/path is read and written as bucket/path under a root directory.
+
+    Like gcsfs, listings return paths without the gs:// prefix, and like gcsfs
+    it claims the gs protocol, so DuckDB's register_filesystem routes gs:// paths to it.
+    """
+
+    protocol = ("gs", "gcs")
+
+    @classmethod
+    def _strip_protocol(cls, path):
+        if isinstance(path, str) and path.startswith("gs://"):
+            path = path[len("gs://"):]
+        return super()._strip_protocol(path)
+
+
+class ThrottledFileOpener(LocalFileOpener):
+    """A local file charging the simulated transfer time of what is read and written."""
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        self.fs.transfer(len(data))
+        return data
+
+    def readinto(self, buffer):
+        nbytes = self.f.readinto(buffer)
+        self.fs.transfer(nbytes)
+        return nbytes
+
+    def write(self, data):
+        self.fs.transfer(len(data))
+        return super().write(data)
+
+
+class SimulatedGcsFileSystem(LocalFileSystem):
+    """Local disk with the request latency and per-stream throughput of GCS.
+
+    The waits release the GIL, so parallel transfers overlap like they do
+    against GCS and the effect of upload parallelism can be measured offline.
+    """
+
+    def __init__(self, latency: float = DEFAULT_LATENCY, throughput: float = DEFAULT_THROUGHPUT, **kwargs):
+        """
+        @param latency: The wait before each request, in seconds.
+        @param throughput: The transfer rate of each open file, in MB/s.
+        """
+        super().__init__(auto_mkdir=True, **kwargs)
+        self.latency = latency
+        self.bytes_per_second = throughput * 1e6
+
+    def request(self) -> None:
+        time.sleep(self.latency)
+
+    def transfer(self, nbytes: int) -> None:
+        time.sleep(nbytes / self.bytes_per_second)
+
+    def info(self, path, **kwargs):
+        self.request()
+        return super().info(path, **kwargs)
+
+    def exists(self, path, **kwargs):
+        self.request()
+        return super().exists(path, **kwargs)
+
+    def ls(self, path, detail=False, **kwargs):
+        self.request()
+        return super().ls(path, detail=detail, **kwargs)
+
+    def cp_file(self, path1, path2, **kwargs):
+        # a server side copy, no data goes through the client
+        self.request()
+        return super().cp_file(path1, path2, **kwargs)
+
+    def rm_file(self, path):
+        self.request()
+        return super().rm_file(path)
+
+    def _open(self, path, mode="rb", block_size=None, **kwargs):
+        self.request()
+        path = self._strip_protocol(path)
+        if "w" in mode:
+            self.makedirs(self._parent(path), exist_ok=True)
+        return ThrottledFileOpener(path, mode, fs=self, **kwargs)
+
+
+def get_file_system() -> fsspec.AbstractFileSystem:
+    """Gets the filesystem the gs:// paths of the pipeline are read from and written to.
+
+    The backend is chosen by the NAERING_STORAGE environment variable:
+    gcs (the default) for Google Cloud Storage through Dapla, local for files
+    under NAERING_STORAGE_ROOT, memory for an in-process filesystem, and
+    simulated for local files with the latency and throughput of GCS, set by
+    NAERING_STORAGE_LATENCY and NAERING_STORAGE_THROUGHPUT.
+
+    @return: The filesystem.
+    """
+    backend = os.environ.get(STORAGE_BACKEND_VARIABLE, "gcs")
+    if backend == "gcs":
+        import dapla as dp
+
+        return dp.FileClient.get_gcs_file_system()
+
+    root = os.environ.get(STORAGE_ROOT_VARIABLE, str(DEFAULT_STORAGE_ROOT))
+    if backend == "local":
+        return GcsPathFileSystem(path=root, fs=LocalFileSystem(auto_mkdir=True))
+    if backend == "memory":
+        return GcsPathFileSystem(path="/gcs", fs=MemoryFileSystem())
+    if backend == "simulated":
+        latency = float(os.environ.get(STORAGE_LATENCY_VARIABLE, DEFAULT_LATENCY))
+        throughput = float(os.environ.get(STORAGE_THROUGHPUT_VARIABLE, DEFAULT_THROUGHPUT))
+        logging.debug("Simulating GCS with %.3g seconds latency and %.3g MB/s under %s", latency, throughput, root)
+        return GcsPathFileSystem(path=root, fs=SimulatedGcsFileSystem(latency, throughput))
+
+    raise ValueError(f"Unknown {STORAGE_BACKEND_VARIABLE} {backend!r}, expected one of {STORAGE_BACKENDS}")
+
+
+def get_path_file_system(path: str) -> fsspec.AbstractFileSystem:
+    """Gets the filesystem to read or write a path given on the command line.
+
+    @param path: A local path or a gs:// path.
+    @return: The NAERING_STORAGE filesystem for gs:// paths, otherwise the local filesystem.
+    """
+    if path.startswith("gs://"):
+        return get_file_system()
+
+    return LocalFileSystem(auto_mkdir=True)
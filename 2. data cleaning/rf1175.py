@@ -0,0 +1,585 @@
+"""
+The RF-1175 posts of the skatteobjekter, as mappings from O_ variables to type codes or columns.
+
+A post of a type coded skatteobjekt is the sum of beloep over its type
+codes, so summed posts like O_37279 = 3910 + 7911 are a mapping to several
+codes, and a code may feed more than one post. The other skatteobjekter map
+each post to a Spark SQL expression over their columns.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# the view the skatteobjekt SQLs read the tverrsnitt from
+SOURCE_VIEW = "naeringsspesifikasjon"
+
+# the RF-1175 population
+VIRKSOMHETSTYPER = ("enkeltpersonforetak", "selskapMedDeltakerfastsetting", "samvirkeforetak")
+REGNSKAPSPLIKTSTYPER = ("ingenRegnskapsplikt", "begrensetRegnskapsplikt")
+
+# the lists are joined explicitly, a one-element tuple would render as ('x',)
+VIRKSOMHETSTYPER_SQL = ", ".join(f"'{value}'" for value in VIRKSOMHETSTYPER)
+REGNSKAPSPLIKTSTYPER_SQL = ", ".join(f"'{value}'" for value in REGNSKAPSPLIKTSTYPER)
+
+POPULATION_FILTER_SQL = (
+    f"naeringsspesifikasjon.virksomhet.virksomhetstype IN ({VIRKSOMHETSTYPER_SQL})"
+    f" AND naeringsspesifikasjon.virksomhet.regnskapspliktstype IN ({REGNSKAPSPLIKTSTYPER_SQL})"
+)
+
+# the int64 orgnr column of the population index
+POPULATION_KEY = "orgnr_key"
+
+# the wide table of all skatteobjekter, one row per orgnr
+MERGED_NAME = "RF1175"
+
+# number of skatteobjekter written concurrently by default
+SECTION_WORKERS = 4
+
+# the posts of each skatteobjekt by df_name, O_ variable -> type codes, in the column order of the output
+SECTION_POSTS: dict[str, dict[str, tuple[str, ...]]] = {
+    "salgsinntekt": {
+        "O_7360": ("3000",),
+        "O_7362": ("3100",),
+        "O_7364": ("3200",),
+        "O_15843": ("3300",),
+    },
+    "annenDriftsinntekt": {
+        "O_7368": ("3400",),
+        "O_39729": ("3410",),
+        "O_7370": ("3600",),
+        "O_17163": ("3650",),
+        "O_32864": ("3695",),
+        "O_7374": ("3700",),
+        # ny ORID
+        "O_737475": ("3710",),
+        "O_13676": ("3890",),
+        "O_7266": ("3895",),
+        "O_7376": ("3900",),
+        # 3910 og 7911 ble før rapportert netto (se RF-skjema) og ble ikke opprettet i NO-basen,
+        # summeres her for å ikke miste informasjon
+        "O_37279": ("3910", "7911"),
+    },
+    "varekostnad": {
+        "O_7378": ("4005",),
+        "O_7380": ("4295",),
+        "O_7382": ("4500",),
+        "O_7384": ("4995",),
+    },
+    "loennskostnad": {
+        "O_15844": ("5000",),
+        "O_15845": ("5300",),
+        "O_15846": ("5400",),
+        "O_7392": ("5420",),
+        # O_38841 (5600) skal ikke med i 1175, det er data som ikke finnes i NO-basen fra før
+        "O_7396": ("5900",),
+        "O_27426": ("5950",),
+    },
+    "annenDriftskostnad": {
+        "O_15847": ("6000",),
+        "O_7400": ("6100",),
+        "O_15848": ("6200",),
+        "O_7404": ("6300",),
+        "O_7408": ("6340",),
+        "O_7406": ("6395",),
+        "O_15849": ("6400",),
+        # ny ORID, erstatter tidligere 6310, O_28121
+        "O_2812175": ("6440",),
+        "O_15850": ("6500",),
+        "O_7269": ("6600",),
+        "O_15836": ("6695",),
+        "O_7414": ("6700",),
+        "O_7416": ("6995",),
+        # ny ORID, tidligere post fra skjema 7098 O_32836, nå 6998
+        "O_3283675": ("6998",),
+        "O_7418": ("7000",),
+        "O_7422": ("7020",),
+        "O_15851": ("7040",),
+        "O_7273": ("7080",),
+        "O_15801": ("7099",),
+        "O_7424": ("7155",),
+        "O_7426": ("7165",),
+        "O_7428": ("7295",),
+        "O_7275": ("7330",),
+        "O_7277": ("7350",),
+        # ny ORID, tidligere post 7495, O_7279, nå 7400
+        "O_727975": ("7400",),
+        # ny post Gaver, fradragsberettiget
+        "O_728075": ("7420",),
+        "O_11334": ("7500",),
+        "O_7430": ("7565",),
+        "O_7432": ("7600",),
+        "O_15837": ("7700",),
+        "O_1202": ("7890",),
+        # ny ORID, tidligere post 7895, O_34056
+        "O_3405675": ("7830",),
+        # ny ORID, tidligere post 7896, O_34058
+        "O_3405875": ("7860",),
+        "O_7283": ("7897",),
+        "O_37281": ("7910",),
+        # for 7911 se også 3910 på annenDriftsinntekt
+        "O_757911": ("7911",),
+    },
+    "finansinntekt": {
+        "O_38885": ("8005",),
+        "O_38887": ("8050",),
+        # Gevinst ved realisasjon av aksjer, egenkapitalbevis og fondsandeler
+        "O_38888": ("8074",),
+        "O_15852": ("8060",),
+        # tidligere 8099
+        "O_15853": ("8079",),
+        "O_38889": ("8090",),
+        # 3 % av netto skattefrie inntekter etter fritaksmetoden og 3 % av utdeling fra selskap med
+        # deltakerfastsetting til selskapsdeltaker
+        "O_88888": ("8091",),
+    },
+    "finanskostnad": {
+        "O_758105": ("8105",),
+        "O_38891": ("8150",),
+        "O_15854": ("8160",),
+        "O_38890": ("8174",),
+        # tidligere post 8199
+        "O_7441": ("8179",),
+    },
+    "balanseverdiForAnleggsmiddel": {
+        "O_7445": ("1000",),
+        "O_2400": ("1020",),
+        "O_7447": ("1080",),
+        "O_15796": ("1105",),
+        "O_15795": ("1115",),
+        "O_36968": ("1117",),
+        "O_32838": ("1120",),
+        "O_7451": ("1130",),
+        "O_7454": ("1150",),
+        "O_7456": ("1160",),
+        "O_15792": ("1205",),
+        "O_15793": ("1221",),
+        "O_15794": ("1225",),
+        "O_15791": ("1238",),
+        "O_37283": ("1239",),
+        "O_15790": ("1280",),
+        "O_26535": ("1290",),
+        "O_7306": ("1295",),
+        "O_15838": ("1296",),
+        "O_37285": ("1298",),
+        # Investeringer i aksjer, andeler og verdipapirfondsandeler
+        "O_38915": ("1350",),
+        "O_38916": ("1360", "1350"),
+        # 1370, 1380 og 1390 brukes i år som omløpsmiddel på RF-1175 siden de ikke ble opprettet i NO-basen
+        "O_38917": ("1370",),
+        "O_38918": ("1380",),
+        "O_38919": ("1390",),
+    },
+    "balanseverdiForOmloepsmiddel": {
+        # ny ORID, tidligere post 1495, O_15768 (test mot sumVerdiAvVarelager fra spesifikasjonAvVarelager)
+        "O_1576875": ("1400",),
+        # ny ORID
+        "O_140175": ("1401",),
+        "O_18116": ("1500",),
+        "O_26537": ("1530",),
+        # Kortsiktige fordringer mot personlig eier, styremedlem o.l.
+        "O_38924": ("1565",),
+        "O_38925": ("1570",),
+        # post 1595 med ORID 7310 forsvinner, så 7310 blir tom fra Sirius data i NO-basen for ENK
+        "O_7471": ("1780",),
+        # Ikke-markedsbaserte aksjer og verdipapirfondsandeler
+        "O_38927": ("1800",),
+        # Markedsbaserte aksjer og verdipapirfondsandeler
+        "O_51810": ("1810",),
+        # Markedsbaserte obligasjoner, sertifikater mv., tidligere 1869 levert som O_7473
+        "O_38928": ("1830",),
+        # tidligere 1869
+        "O_7474": ("1880",),
+        "O_15789": ("1895",),
+        "O_15812": ("1900",),
+        "O_7477": ("1920",),
+        "O_7315": ("1950",),
+    },
+    "Egenkapital": {
+        # post 2000 Aksjekap./EK andre foretak er ny for regnskapspliktstype 1, summen må kontrolleres mot data
+        "O_7479": ("2015",),
+        "O_7481": ("2050",),
+        "O_7483": ("2080",),
+        "O_1471": ("2095",),
+        "O_15839": ("2096",),
+        "O_15803": ("2097",),
+        "O_37287": ("2098",),
+        "O_38936": ("2000",),
+    },
+    "LangsiktigGjeld": {
+        "O_7485": ("2220",),
+        # tidligere post 2275
+        "O_7327": ("2290",),
+        # tidligere post 2289
+        "O_7487": ("2280", "2289"),
+        "O_38945": ("2250",),
+        "O_38947": ("2290",),
+    },
+    "KortsiktigGjeld": {
+        "O_7489": ("2380",),
+        "O_7491": ("2400",),
+        "O_7493": ("2600",),
+        "O_7495": ("2740",),
+        "O_7497": ("2770",),
+        "O_7499": ("2790",),
+        "O_29065": ("2800",),
+        "O_7501": ("2900",),
+        "O_7503": ("2910",),
+        "O_7505": ("2949",),
+        "O_7507": ("2950",),
+        # ny ORID, tidligere 2995, O_7509
+        "O_750975": ("2990",),
+    },
+}
+
+
+# the posts of the other skatteobjekter by df_name, O_ variable -> Spark SQL expression
+SECTION_COLUMNS: dict[str, dict[str, str]] = {
+    "virksomhet": {
+        "O_15805": "start",
+        "O_15806": "slutt",
+    },
+    "spesifikasjonAvVarelager": {
+        "O_15764": "raavareOgInnkjoeptHalvfabrikata",
+        "O_15765": "vareUnderTilvirkning",
+        "O_15766": "ferdigTilvirketVare",
+        "O_15767": "innkjoeptVareForVideresalg",
+        "O_9669": "buskap",
+        "O_17165": "selvprodusertVareBenyttetIEgenProduksjon",
+        "O_31625": "reinPelsdyrOgPelsdyrskinnPaaLager",
+        # se også balanseverdiForOmloepsmiddel
+        "O_15768": "sumVerdiAvVarelager",
+    },
+    "sum_resultatregnskap": {
+        # Sum driftsinntekt
+        "O_15799": "sumDriftsinntekt",
+        # Sum driftskostnad
+        "O_7286": "sumDriftskostnad",
+        # Driftsresultat
+        "O_6686": "sumDriftsinntekt - sumDriftskostnad",
+        # Sum finansinntekter
+        "O_13962": "sumFinansinntekt",
+        # Sum finanskostnader
+        "O_13964": "sumFinanskostnad",
+        # Resultat
+        "O_6675": "aarsresultat",
+        # O_28070: piloten gjelder kun enkeltpersonforetak, dermed vil alt overføres fra O_6675, se s.2 NO1 post 9930
+        # (se post fra skjema 0401 resultat rad 240 i mapping excel). Skal ikke med i 1175, det er data som ikke
+        # finnes i NO-basen fra før og noen har utgått.
+        # "O_28070": "aarsresultat",
+    },
+    "sum_balanseregnskap": {
+        # sumBalanseverdiForAnleggsmiddel og sumBalanseverdiForOmloepsmiddel eksisterer ikke i NO-basen, men kan
+        # brukes for å kontrollere
+        # "O_NY_ORID_sum_bal1": "sumBalanseverdiForAnleggsmiddel",  # ny post 9300 Sum anleggsmidler
+        # "O_NY_ORID_sum_bal2": "sumBalanseverdiForOmloepsmiddel",  # ny post 9350 Sum omløpsmidler
+        # ny post 9400 Sum Eiendeler
+        "O_15797": "sumBalanseverdiForEiendel",
+        # Sum skattemessig egenkapital post 9970 MÅ SJEKKES OM DET KOMMER DIREKTE SOM SKATTEMESSIG
+        # "O_7318": "sumEgenkapital",
+        # post 9970 Sum ubeskattet egenkapital MÅ SJEKKES OM DET KOMMER DIREKTE SOM UBESKATTET
+        # "O_7324": "sumEgenkapital",
+        # post 9450 Sum ubeskattet egenkapital MÅ SJEKKES OM DET KOMMER DIREKTE SOM UBESKATTET
+        "O_75250": "sumEgenkapital",
+        # sumLangsiktigGjeld og sumKortsiktigGjeld eksisterer ikke i NO-basen, men kan brukes for å kontrollere
+        # "O_NY_ORID_sum_bal3": "sumLangsiktigGjeld",  # ny post 9500 Sum Langsiktig Gjeld
+        # "O_NY_ORID_sum_bal4": "sumKortsiktigGjeld",  # ny post 9550 Sum kortsiktig gjeld
+        # post 9990 Sum gjeld MÅ SEES OM DET KOMMER DIREKTE OGSÅ
+        # "O_15855": "sumLangsiktigGjeld + sumKortsiktigGjeld",
+        # post 9500 Sum langsiktig gjeld
+        "O_38948": "sumLangsiktigGjeld",
+        # post 9550 Sum kortsiktig gjeld
+        "O_38958": "sumKortsiktigGjeld",
+        # post 9995 SUM EGENKAPITAL OG GJELD
+        "O_7511": "sumGjeldOgEgenkapital",
+        "O_38920": "sumBalanseverdiForAnleggsmiddel",
+        "O_38934": "sumBalanseverdiForOmloepsmiddel",
+        "kontroll": "sumBalanseverdiForEiendel - sumGjeldOgEgenkapital",
+        # Egenkapital 31.12.2020, midlertidige forskjeller 31.12.2020, jf. RF-1217, og korrigert egenkapital
+        # 1.1.2021: side 4 fra skjema trenger ikke kodes siden RF-1052 brukes i stedet
+    },
+}
+
+# skatteobjekter written one row per row read instead of summed per orgnr
+UNAGGREGATED_SECTIONS = {"virksomhet"}
+
+# the skatteobjekter written by run_sections, in the order of the notebook
+SECTIONS = [
+    "virksomhet",
+    "spesifikasjonAvVarelager",
+    "salgsinntekt",
+    "annenDriftsinntekt",
+    "varekostnad",
+    "loennskostnad",
+    "annenDriftskostnad",
+    "finansinntekt",
+    "finanskostnad",
+    "balanseverdiForAnleggsmiddel",
+    "balanseverdiForOmloepsmiddel",
+    "Egenkapital",
+    "LangsiktigGjeld",
+    "KortsiktigGjeld",
+    "sum_resultatregnskap",
+    "sum_balanseregnskap",
+]
+
+
+# where the rows of each skatteobjekt are in naeringsspesifikasjon, for engines reading the tverrsnitt
+# directly: the array of the skatteobjekt, one row per element, or one row per submission if not here
+SECTION_ARRAYS: dict[str, str] = {
+    "spesifikasjonAvVarelager": "spesifikasjonAvOmloepsmiddel.spesifikasjonAvVarelager",
+    "salgsinntekt": "resultatregnskap.driftsinntekt.salgsinntekt.inntekt",
+    "annenDriftsinntekt": "resultatregnskap.driftsinntekt.annenDriftsinntekt.inntekt",
+    "varekostnad": "resultatregnskap.driftskostnad.varekostnad.kostnad",
+    "loennskostnad": "resultatregnskap.driftskostnad.loennskostnad.kostnad",
+    "annenDriftskostnad": "resultatregnskap.driftskostnad.annenDriftskostnad.kostnad",
+    "finansinntekt": "resultatregnskap.finansinntekt.inntekt",
+    "finanskostnad": "resultatregnskap.finanskostnad.kostnad",
+    "balanseverdiForAnleggsmiddel": "balanseregnskap.anleggsmiddel.balanseverdiForAnleggsmiddel.balanseverdi",
+    "balanseverdiForOmloepsmiddel": "balanseregnskap.omloepsmiddel.balanseverdiForOmloepsmiddel.balanseverdi",
+    "Egenkapital": "balanseregnskap.gjeldOgEgenkapital.egenkapital.kapital",
+    "LangsiktigGjeld": "balanseregnskap.gjeldOgEgenkapital.langsiktigGjeld.gjeld",
+    "KortsiktigGjeld": "balanseregnskap.gjeldOgEgenkapital.kortsiktigGjeld.gjeld",
+}
+
+# the columns of the skatteobjekter in SECTION_COLUMNS, column -> path in naeringsspesifikasjon,
+# or in the array element for the skatteobjekter in SECTION_ARRAYS
+SECTION_FIELDS: dict[str, dict[str, str]] = {
+    "virksomhet": {
+        "start": "virksomhet.regnskapsperiode.start",
+        "slutt": "virksomhet.regnskapsperiode.slutt",
+    },
+    "spesifikasjonAvVarelager": {
+        "raavareOgInnkjoeptHalvfabrikata": "raavareOgInnkjoeptHalvfabrikata",
+        "vareUnderTilvirkning": "vareUnderTilvirkning",
+        "ferdigTilvirketVare": "ferdigTilvirketVare",
+        "innkjoeptVareForVideresalg": "innkjoeptVareForVideresalg",
+        "buskap": "buskap",
+        "selvprodusertVareBenyttetIEgenProduksjon": "selvprodusertVareBenyttetIEgenProduksjon",
+        "reinPelsdyrOgPelsdyrskinnPaaLager": "reinPelsdyrOgPelsdyrskinnPaaLager",
+        "sumVerdiAvVarelager": "sumVerdiAvVarelager",
+    },
+    "sum_resultatregnskap": {
+        "sumDriftsinntekt": "resultatregnskap.driftsinntekt.sumDriftsinntekt",
+        "sumDriftskostnad": "resultatregnskap.driftskostnad.sumDriftskostnad",
+        "sumFinansinntekt": "resultatregnskap.sumFinansinntekt",
+        "sumFinanskostnad": "resultatregnskap.sumFinanskostnad",
+        "aarsresultat": "resultatregnskap.aarsresultat",
+    },
+    "sum_balanseregnskap": {
+        "sumBalanseverdiForEiendel": "balanseregnskap.sumBalanseverdiForEiendel",
+        "sumEgenkapital": "balanseregnskap.gjeldOgEgenkapital.sumEgenkapital",
+        "sumLangsiktigGjeld": "balanseregnskap.gjeldOgEgenkapital.sumLangsiktigGjeld",
+        "sumKortsiktigGjeld": "balanseregnskap.gjeldOgEgenkapital.sumKortsiktigGjeld",
+        "sumGjeldOgEgenkapital": "balanseregnskap.sumGjeldOgEgenkapital",
+        "sumBalanseverdiForAnleggsmiddel": "balanseregnskap.anleggsmiddel.sumBalanseverdiForAnleggsmiddel",
+        "sumBalanseverdiForOmloepsmiddel": "balanseregnskap.omloepsmiddel.sumBalanseverdiForOmloepsmiddel",
+    },
+}
+
+
+def post_type_codes(posts: dict[str, tuple[str, ...]]) -> list[str]:
+    """The type codes the posts are derived from, each once and sorted."""
+    return sorted({code for codes in posts.values() for code in codes})
+
+
+def sum_posts(sdf, posts: dict[str, tuple[str, ...]]):
+    """Sums the posts of a type coded skatteobjekt per orgnr.
+
+    The beloep are pivoted by type in one aggregate over (orgnr, type), and
+    every post is the sum of the pivoted columns of its codes, instead of a
+    masked copy of beloep per post before the groupby. Every orgnr of the
+    skatteobjekt gets a row, with 0 for the posts it has no beloep for.
+
+    @param sdf: The Spark skatteobjekt, with orgnr, type and beloep.
+    @param posts: O_ variable -> type codes, one of SECTION_POSTS.
+    @return: A Spark DataFrame with orgnr and the posts.
+    """
+    from pyspark.sql import functions as F
+
+    pivoted = sdf.groupBy("orgnr").pivot("type", post_type_codes(posts)).sum("beloep")
+    return pivoted.select(
+        "orgnr",
+        *[sum(F.coalesce(F.col(code), F.lit(0)) for code in codes).alias(variable) for variable, codes in posts.items()],
+    )
+
+
+def derive_section(sdf, df_name: str):
+    """Derives the posts of a skatteobjekt from its rows in the population.
+
+    Like functions.fillna, missing numbers are 0 and missing booleans False first.
+
+    @param sdf: The Spark skatteobjekt.
+    @param df_name: The skatteobjekt, one of SECTIONS.
+    @return: A Spark DataFrame with orgnr and the posts.
+    """
+    from pyspark.sql import functions as F
+
+    sdf = sdf.fillna(0).fillna(False)
+    if df_name in SECTION_POSTS:
+        return sum_posts(sdf, SECTION_POSTS[df_name])
+
+    columns = SECTION_COLUMNS[df_name]
+    derived = sdf.select("orgnr", *[F.expr(expression).alias(variable) for variable, expression in columns.items()])
+    if df_name in UNAGGREGATED_SECTIONS:
+        return derived
+    return derived.groupBy("orgnr").agg(*[F.sum(variable).alias(variable) for variable in columns])
+
+
+def population_index(spark, source_path: str) -> np.ndarray:
+    """Finds the RF-1175 population of the tverrsnitt.
+
+    The virksomhetstype and regnskapspliktstype strings are compared once per
+    submission here, instead of on every row of every skatteobjekt. An orgnr
+    that is not a number has no int64 key and is left out, with a warning.
+
+    @param spark: The SparkSession.
+    @param source_path: The tverrsnitt Parquet, e.g. TVERRSNITT_NAERINGSSPESIFIKASJON.
+    @return: The orgnr of the population as a sorted int64 array without duplicates.
+    """
+    from pyspark.sql import functions as F
+
+    orgnr = F.col("naeringsspesifikasjon.norskIdentifikator")
+    keys = (spark.read.parquet(source_path)
+            .where(POPULATION_FILTER_SQL)
+            .where(orgnr.isNotNull())
+            .select(orgnr.cast("long").alias(POPULATION_KEY),
+                    F.when(orgnr.cast("long").isNull(), orgnr).alias("non_numeric_orgnr"))
+            .distinct()
+            .toPandas())
+    non_numeric = keys["non_numeric_orgnr"].nunique()
+    if non_numeric:
+        logging.warning("Left %d orgnr that are not numbers out of the RF-1175 population", non_numeric)
+    population = np.sort(keys[POPULATION_KEY].dropna().to_numpy(dtype=np.int64))
+    logging.info("Found %d orgnr in the RF-1175 population", len(population))
+    return population
+
+
+def population_frame(spark, population: np.ndarray):
+    """The population index as a broadcast Spark DataFrame to semi-join against, see in_population."""
+    from pyspark.sql import functions as F
+
+    return F.broadcast(spark.createDataFrame(pd.DataFrame({POPULATION_KEY: population})))
+
+
+def in_population(sdf, population_df, orgnr_column: str = "orgnr"):
+    """Keeps the rows of the orgnr in the population.
+
+    A broadcast hash semi-join on the int64 orgnr, replacing the isin masks
+    over virksomhetstype and regnskapspliktstype. An orgnr that is not a
+    number never matches, population_index warns about those.
+
+    @param sdf: A Spark DataFrame.
+    @param population_df: The population index, from population_frame.
+    @param orgnr_column: The orgnr column of sdf, a dotted path for struct fields.
+    @return: The rows of sdf in the population.
+    """
+    from pyspark.sql import functions as F
+
+    return sdf.join(population_df, F.col(orgnr_column).cast("long") == F.col(POPULATION_KEY), "left_semi")
+
+
+def merge_sections(section_dfs):
+    """Merges derived skatteobjekter into one wide table, one row per orgnr sorted by orgnr.
+
+    The skatteobjekter are stacked by column name and aggregated per orgnr in
+    one shuffle, the equivalent of a full outer join of them all on orgnr.
+    Like functions.fillna, the posts of an orgnr missing from a skatteobjekt
+    are 0, or False for booleans, and other columns are left missing.
+
+    @param section_dfs: The derived Spark skatteobjekter by df_name, see derive_section.
+    @return: A Spark DataFrame with orgnr and the posts of all skatteobjekter, in one sorted partition.
+    """
+    from functools import reduce
+
+    from pyspark.sql import functions as F
+    from pyspark.sql.types import BooleanType, NumericType
+
+    stacked = reduce(lambda left, right: left.unionByName(right, allowMissingColumns=True), section_dfs.values())
+
+    aggregates = []
+    for field in stacked.schema.fields:
+        if field.name == "orgnr":
+            continue
+        if isinstance(field.dataType, NumericType):
+            aggregates.append(F.coalesce(F.sum(field.name), F.lit(0)).alias(field.name))
+        elif isinstance(field.dataType, BooleanType):
+            aggregates.append(F.coalesce(F.max(field.name), F.lit(False)).alias(field.name))
+        else:
+            # start and slutt of the one virksomhet of the orgnr
+            aggregates.append(F.max(field.name).alias(field.name))
+
+    return stacked.groupBy("orgnr").agg(*aggregates).repartition(1).sortWithinPartitions("orgnr")
+
+
+def run_sections(spark,
+                 source_path: str,
+                 section_sqls: dict[str, str],
+                 output_dirname: str,
+                 population: np.ndarray | None = None,
+                 max_workers: int = SECTION_WORKERS,
+                 merged: bool = False) -> dict[str, str]:
+    """Derives and writes the skatteobjekter from one cached read of the tverrsnitt.
+
+    The tverrsnitt is semi-joined with the RF-1175 population index once,
+    cached and registered as the SOURCE_VIEW the skatteobjekt SQLs read from,
+    so the view stays filtered afterwards. The writes are submitted from worker
+    threads and run as concurrent jobs of the session on the shared cache.
+    A failing skatteobjekt is logged and does not stop the others.
+
+    With merged, the skatteobjekter are instead merged on orgnr into one wide
+    table, written as {output_dirname}/RF1175 in a single job, see merge_sections.
+
+    @param spark: The SparkSession.
+    @param source_path: The tverrsnitt Parquet, e.g. TVERRSNITT_NAERINGSSPESIFIKASJON.
+    @param section_sqls: The SQL of each skatteobjekt to write by df_name, from nst.utflating.
+    @param output_dirname: The directory the skatteobjekter are written to, one Parquet dataset per df_name.
+    @param population: The population index, found from the tverrsnitt if not given.
+    @param max_workers: The number of skatteobjekter written at the same time.
+    @param merged: Whether to write one wide table instead of one Parquet dataset per skatteobjekt.
+    @return: The output path per df_name, or of MERGED_NAME if merged.
+    @raise RuntimeError: If any of the skatteobjekter failed.
+    """
+    if population is None:
+        population = population_index(spark, source_path)
+
+    base = in_population(spark.read.parquet(source_path),
+                         population_frame(spark, population),
+                         "naeringsspesifikasjon.norskIdentifikator").cache()
+    base.createOrReplaceTempView(SOURCE_VIEW)
+    logging.info("Cached %d rows of the RF-1175 population from %s", base.count(), source_path)
+
+    def write_section(df_name: str) -> str:
+        output_path = f"{output_dirname}/{df_name}"
+        spark.sparkContext.setJobDescription(f"RF-1175 {df_name}")
+        derive_section(spark.sql(section_sqls[df_name]), df_name).write.mode("overwrite").parquet(output_path)
+        return output_path
+
+    output_paths: dict[str, str] = {}
+    failed_sections: list[str] = []
+    try:
+        if merged:
+            output_paths[MERGED_NAME] = f"{output_dirname}/{MERGED_NAME}"
+            spark.sparkContext.setJobDescription(f"RF-1175 {MERGED_NAME}")
+            section_dfs = {df_name: derive_section(spark.sql(sql), df_name) for df_name, sql in section_sqls.items()}
+            merge_sections(section_dfs).write.mode("overwrite").parquet(output_paths[MERGED_NAME])
+            logging.info("Wrote %d skatteobjekter merged to %s", len(section_dfs), output_paths[MERGED_NAME])
+            return output_paths
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rf1175") as executor:
+            futures = {executor.submit(write_section, df_name): df_name for df_name in section_sqls}
+            for future in as_completed(futures):
+                df_name = futures[future]
+                try:
+                    output_paths[df_name] = future.result()
+                    logging.info("Wrote %s to %s", df_name, output_paths[df_name])
+                except Exception:
+                    logging.exception("Failed to derive skatteobjekt %s", df_name)
+                    failed_sections.append(df_name)
+    finally:
+        base.unpersist()
+
+    if failed_sections:
+        raise RuntimeError(f"Failed to derive skatteobjekter: {', '.join(sorted(failed_sections))}")
+    return output_paths
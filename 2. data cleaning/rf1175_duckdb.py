@@ -0,0 +1,294 @@
+"""
+Runs the RF-1175 derivations of 1175.py in-process on DuckDB over the tverrsnitt Parquet, without a Spark cluster.
+
+The skatteobjekter are selected from naeringsspesifikasjon by the paths in
+rf1175.SECTION_ARRAYS and SECTION_FIELDS instead of the Spark SQLs of
+nst.utflating, and derived from the same mappings. Each is written as
+{output_dirname}/{df_name}/part-00000.parquet, so the RF1175_{tverrsnitt}_{tverrsnitt_versjon}
+directories read like the ones written by Spark. With --merged, one wide
+table of all skatteobjekter is written as {output_dirname}/RF1175 instead.
+
+    python rf1175_duckdb.py gs://.../naeringsspesifikasjon_2023.parquet gs://.../RF1175_2023_1
+"""
+import argparse
+import logging
+import sys
+import timeit
+from pathlib import Path
+
+import duckdb
+import fsspec
+import pyarrow.parquet as pq
+
+import rf1175
+
+# the sorted int64 orgnr of the RF-1175 population, see rf1175.population_index
+POPULATION_TABLE = "rf1175_population"
+
+# the submissions of the population, with the parts of naeringsspesifikasjon the skatteobjekter are read from
+BASE_TABLE = "rf1175_base"
+BASE_COLUMNS = ("virksomhet", "resultatregnskap", "balanseregnskap", "spesifikasjonAvOmloepsmiddel")
+
+# rows per row group of the merged table, small enough for orgnr lookups to skip most row groups
+LOOKUP_ROW_GROUP_SIZE = 64 * 1024
+
+POPULATION_SQL = f"""
+    CREATE OR REPLACE TABLE {POPULATION_TABLE} AS
+    SELECT DISTINCT
+        TRY_CAST(naeringsspesifikasjon.norskIdentifikator AS BIGINT) AS {rf1175.POPULATION_KEY}
+    FROM
+        read_parquet(?)
+    WHERE
+        {rf1175.POPULATION_FILTER_SQL}
+        AND {rf1175.POPULATION_KEY} IS NOT NULL
+    ORDER BY
+        {rf1175.POPULATION_KEY}
+"""
+
+# orgnr of the population that are not numbers, left out of the int64 population index
+NON_NUMERIC_SQL = f"""
+    SELECT
+        COUNT(DISTINCT naeringsspesifikasjon.norskIdentifikator)
+    FROM
+        read_parquet(?)
+    WHERE
+        {rf1175.POPULATION_FILTER_SQL}
+        AND naeringsspesifikasjon.norskIdentifikator IS NOT NULL
+        AND TRY_CAST(naeringsspesifikasjon.norskIdentifikator AS BIGINT) IS NULL
+"""
+
+BASE_SQL = f"""
+    CREATE OR REPLACE TABLE {BASE_TABLE} AS
+    SELECT
+        source.naeringsspesifikasjon.norskIdentifikator AS orgnr,
+        {", ".join(f"source.naeringsspesifikasjon.{column}" for column in BASE_COLUMNS)}
+    FROM
+        read_parquet(?) AS source
+    SEMI JOIN {POPULATION_TABLE}
+        ON TRY_CAST(source.naeringsspesifikasjon.norskIdentifikator AS BIGINT)
+           = {POPULATION_TABLE}.{rf1175.POPULATION_KEY}
+"""
+
+
+def rows_from_sql(df_name: str) -> str:
+    """The FROM of a skatteobjekt, unnesting its array to one row per element."""
+    if df_name in rf1175.SECTION_ARRAYS:
+        return f"{BASE_TABLE} AS base, UNNEST(base.{rf1175.SECTION_ARRAYS[df_name]}) AS elements(element)"
+    return f"{BASE_TABLE} AS base"
+
+
+def posts_sql(df_name: str) -> str:
+    """Creates the SQL of a type coded skatteobjekt, every post a filtered sum in one aggregate per orgnr.
+
+    @param df_name: The skatteobjekt, one of rf1175.SECTION_POSTS.
+    @return: The SQL.
+    """
+    post_sums = ",\n        ".join(
+        f"COALESCE(SUM(element.beloep) FILTER (WHERE element.type IN ({', '.join(repr(code) for code in codes)})), 0)"
+        f" AS {variable}"
+        for variable, codes in rf1175.SECTION_POSTS[df_name].items()
+    )
+    return f"""
+    SELECT
+        base.orgnr,
+        {post_sums}
+    FROM
+        {rows_from_sql(df_name)}
+    GROUP BY
+        base.orgnr
+    ORDER BY
+        base.orgnr
+"""
+
+
+def columns_sql(df_name: str) -> str:
+    """Creates the SQL of a skatteobjekt derived from columns.
+
+    Like functions.fillna, missing amounts are 0 before the posts are derived
+    and summed per orgnr; the unaggregated skatteobjekter are taken as they are.
+
+    @param df_name: The skatteobjekt, one of rf1175.SECTION_COLUMNS.
+    @return: The SQL.
+    """
+    aggregated = df_name not in rf1175.UNAGGREGATED_SECTIONS
+    prefix = "element" if df_name in rf1175.SECTION_ARRAYS else "base"
+    fields = ",\n            ".join(
+        f"COALESCE({prefix}.{path}, 0) AS {column}" if aggregated else f"{prefix}.{path} AS {column}"
+        for column, path in rf1175.SECTION_FIELDS[df_name].items()
+    )
+    posts = ",\n        ".join(
+        f"SUM({expression}) AS {variable}" if aggregated else f"{expression} AS {variable}"
+        for variable, expression in rf1175.SECTION_COLUMNS[df_name].items()
+    )
+    return f"""
+    WITH section_rows AS (
+        SELECT
+            base.orgnr,
+            {fields}
+        FROM
+            {rows_from_sql(df_name)}
+    )
+
+    SELECT
+        orgnr,
+        {posts}
+    FROM
+        section_rows
+    {"GROUP BY orgnr" if aggregated else ""}
+    ORDER BY
+        orgnr
+"""
+
+
+def section_sql(df_name: str) -> str:
+    """Creates the SQL deriving the posts of a skatteobjekt from the base table."""
+    return posts_sql(df_name) if df_name in rf1175.SECTION_POSTS else columns_sql(df_name)
+
+
+def merged_sql(sections: list[str]) -> str:
+    """Creates the SQL merging skatteobjekter into one wide table, one row per orgnr sorted by orgnr.
+
+    DuckDB has no sort-merge join, so instead of a chain of full outer joins
+    on orgnr the skatteobjekter are stacked by column name and aggregated per
+    orgnr in one pass. Like functions.fillna, the posts of an orgnr missing
+    from a skatteobjekt are 0, while start and slutt are left missing.
+
+    @param sections: The skatteobjekter to merge, of rf1175.SECTIONS.
+    @return: The SQL.
+    """
+    section_ctes = ",\n".join(f"{df_name} AS ({section_sql(df_name)})" for df_name in sections)
+    stacked = "\n        UNION ALL BY NAME\n        ".join(f"SELECT * FROM {df_name}" for df_name in sections)
+    aggregates = ",\n        ".join(
+        f"MAX({variable}) AS {variable}" if df_name in rf1175.UNAGGREGATED_SECTIONS
+        else f"COALESCE(SUM({variable}), 0) AS {variable}"
+        for df_name in sections
+        for variable in {**rf1175.SECTION_POSTS, **rf1175.SECTION_COLUMNS}[df_name]
+    )
+    return f"""
+    WITH {section_ctes}
+
+    SELECT
+        orgnr,
+        {aggregates}
+    FROM (
+        {stacked}
+    )
+    GROUP BY
+        orgnr
+    ORDER BY
+        orgnr
+"""
+
+
+def write_table(fs: fsspec.AbstractFileSystem, table, dirname: str, row_group_size: int | None = None) -> str:
+    """Replaces a directory with one Parquet file of the table.
+
+    @param fs: The filesystem.
+    @param table: The Arrow table.
+    @param dirname: The directory, written like a Spark dataset.
+    @param row_group_size: The rows per row group, the pyarrow default if None.
+    @return: The Parquet file written.
+    """
+    if fs.exists(dirname):
+        fs.rm(dirname, recursive=True)
+    fs.makedirs(dirname, exist_ok=True)
+    filename = f"{dirname}/part-00000.parquet"
+    with fs.open(filename, mode="wb") as output_file:
+        pq.write_table(table, output_file, row_group_size=row_group_size)
+    return filename
+
+
+def main(source_path: str,
+         output_dirname: str,
+         sections: list[str] = rf1175.SECTIONS,
+         merged: bool = False,
+         fs: fsspec.AbstractFileSystem | None = None) -> dict[str, str]:
+    """
+    Function for deriving the RF-1175 skatteobjekter of a tverrsnitt with DuckDB.
+    Finds the population, reads the parts of its submissions the skatteobjekter
+    need once into a table, then derives and writes each skatteobjekt.
+
+    Parameters
+    ----------
+    source_path: str
+        The tverrsnitt Parquet, local or gs:// path, e.g. TVERRSNITT_NAERINGSSPESIFIKASJON.
+    output_dirname: str
+        The directory the skatteobjekter are written to, e.g. f"{TEMP}/RF1175_{tverrsnitt}_{tverrsnitt_versjon}".
+    sections: list[str]
+        The skatteobjekter to write, of rf1175.SECTIONS.
+    merged: bool
+        Whether to write the skatteobjekter merged on orgnr into one wide, orgnr sorted table,
+        instead of one Parquet per skatteobjekt.
+    fs: fsspec.AbstractFileSystem | None
+        The filesystem the tverrsnitt is read from and the skatteobjekter are written to,
+        the local filesystem if None.
+
+    Returns
+    -------
+    dict[str, str]
+        The Parquet file written per df_name, or of rf1175.MERGED_NAME if merged.
+    """
+    start_time = timeit.default_timer()
+    if fs is None:
+        fs = fsspec.filesystem("file")
+
+    connection = duckdb.connect()
+    if source_path.startswith("gs://"):
+        connection.register_filesystem(fs)
+
+    connection.execute(POPULATION_SQL, [source_path])
+    non_numeric = connection.execute(NON_NUMERIC_SQL, [source_path]).fetchone()[0]
+    if non_numeric:
+        logging.warning("Left %d orgnr that are not numbers out of the RF-1175 population", non_numeric)
+    connection.execute(BASE_SQL, [source_path])
+    logging.info("Read %d submissions of %d orgnr in the RF-1175 population from %s in %.2f seconds",
+                 connection.execute(f"SELECT COUNT(*) FROM {BASE_TABLE}").fetchone()[0],
+                 connection.execute(f"SELECT COUNT(*) FROM {POPULATION_TABLE}").fetchone()[0],
+                 source_path,
+                 timeit.default_timer() - start_time)
+
+    output_filenames = {}
+    if merged:
+        table = connection.execute(merged_sql(sections)).fetch_arrow_table()
+        output_filenames[rf1175.MERGED_NAME] = write_table(fs,
+                                                           table,
+                                                           f"{output_dirname}/{rf1175.MERGED_NAME}",
+                                                           LOOKUP_ROW_GROUP_SIZE)
+        logging.info("Wrote %d skatteobjekter merged into %d rows and %d columns to %s in %.2f seconds",
+                     len(sections),
+                     table.num_rows,
+                     table.num_columns,
+                     output_filenames[rf1175.MERGED_NAME],
+                     timeit.default_timer() - start_time)
+        return output_filenames
+
+    for df_name in sections:
+        section_start_time = timeit.default_timer()
+        table = connection.execute(section_sql(df_name)).fetch_arrow_table()
+        output_filenames[df_name] = write_table(fs, table, f"{output_dirname}/{df_name}")
+        logging.info("Wrote %d rows of %s to %s in %.2f seconds",
+                     table.num_rows, df_name, output_filenames[df_name], timeit.default_timer() - section_start_time)
+
+    logging.info("Derived %d skatteobjekter in %.2f seconds", len(output_filenames), timeit.default_timer() - start_time)
+    return output_filenames
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source_path", help="tverrsnitt Parquet, local or gs:// path")
+    parser.add_argument("output_dirname", help="directory the skatteobjekter are written to, local or gs:// path")
+    parser.add_argument("--sections", nargs="+", choices=rf1175.SECTIONS, default=rf1175.SECTIONS)
+    parser.add_argument("--merged", action="store_true", help="write one wide table merged on orgnr")
+    args = parser.parse_args()
+
+    # the storage backends are shared with the collection pipeline, only the command line picks one
+    sys.path.append(str(Path(__file__).resolve().parents[1] / "1. data collection"))
+    import storage
+
+    main(args.source_path,
+         args.output_dirname,
+         args.sections,
+         args.merged,
+         storage.get_path_file_system(args.output_dirname))
@@ -0,0 +1,294 @@
+"""
+Benchmark of reading the wide (bredt), long (langt) and partitioned layouts
+with PyArrow, DuckDB, Dask and PySpark.
+
+Replaces the time.time() loops copied between the cells of other.ipynb and
+pyspark.ipynb. Every layout is read with every engine for a number of warmup
+and timed repetitions, and the median and p95 time, the peak resident memory
+and the bytes read are logged and appended as one JSON line per layout and
+engine to the results file, so layouts can be compared between runs.
+
+    python benchmark.py --bredt gs://.../resultregnskap_balanseregnskap_testfil_bredt \
+        --langt gs://.../resultregnskap_balanseregnskap_testfil_langt \
+        --partitioned gs://.../partitioned_langt_data \
+        --engines pyarrow duckdb
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+import fsspec
+import psutil
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "1. data collection"))
+import storage  # noqa: E402
+
+LAYOUTS = ["bredt", "langt", "partitioned"]
+ENGINES = ["pyarrow", "duckdb", "dask", "pyspark"]
+
+WARMUP = 1
+REPETITIONS = 5
+RESULTS_FILE = "benchmark_results.jsonl"
+
+# how often the peak resident memory is sampled
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+@dataclass
+class BenchmarkResult:
+    """The result of reading one layout with one engine, without timings and with the error if it failed."""
+    layout: str
+    engine: str
+    path: str
+    rows: int
+    warmup: int
+    repetitions: int
+    median_seconds: float | None
+    p95_seconds: float | None
+    peak_rss_bytes: int
+    bytes_read: int
+    timings: list[float] = field(default_factory=list)
+    error: str | None = None
+    timestamp: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+
+def process_tree() -> list[psutil.Process]:
+    """The benchmark process and its children, e.g. the PySpark JVM."""
+    process = psutil.Process()
+    return [process, *process.children(recursive=True)]
+
+
+def read_chars() -> dict[int, int]:
+    """Bytes read by each process in the tree, from the file, pipe and socket read calls."""
+    chars = {}
+    for process in process_tree():
+        try:
+            chars[process.pid] = process.io_counters().read_chars
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return chars
+
+
+def resident_bytes() -> int:
+    rss = 0
+    for process in process_tree():
+        try:
+            rss += process.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return rss
+
+
+class PeakRssSampler:
+    """Samples the resident memory of the process tree in a background thread
+    while in the with block."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stopped.is_set():
+            self.peak_rss_bytes = max(self.peak_rss_bytes, resident_bytes())
+            self._stopped.wait(self.interval)
+
+    def __enter__(self) -> "PeakRssSampler":
+        self.peak_rss_bytes = resident_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, resident_bytes())
+
+
+def read_pyarrow(path: str, filesystem: fsspec.AbstractFileSystem) -> Callable[[], int]:
+    root = filesystem._strip_protocol(path)
+    return lambda: pq.read_table(root, filesystem=filesystem, partitioning="hive").num_rows
+
+
+def read_duckdb(path: str, filesystem: fsspec.AbstractFileSystem) -> Callable[[], int]:
+    import duckdb
+
+    connection = duckdb.connect()
+    if path.startswith("gs://"):
+        connection.register_filesystem(filesystem)
+    parquet_glob = path if path.endswith(".parquet") else path.rstrip("/") + "/**/*.parquet"
+    return lambda: connection.execute("SELECT * FROM read_parquet(?, hive_partitioning = true)",
+                                      [parquet_glob]).fetch_arrow_table().num_rows
+
+
+def read_dask(path: str, filesystem: fsspec.AbstractFileSystem) -> Callable[[], int]:
+    import dask.dataframe as dd
+
+    root = filesystem._strip_protocol(path)
+    return lambda: len(dd.read_parquet(root, engine="pyarrow", filesystem=filesystem).compute())
+
+
+def read_pyspark(path: str, filesystem: fsspec.AbstractFileSystem) -> Callable[[], int]:
+    from pyspark.sql import SparkSession
+
+    spark = (
+        SparkSession.builder.appName("ParquetPerformanceTest")
+        .config("spark.hadoop.fs.AbstractFileSystem.gs.impl",
+                "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFileSystem")
+        .config("spark.hadoop.google.cloud.auth.service.account.enable", "true")
+        .config("spark.sql.execution.arrow.pyspark.enabled", "true")
+        .getOrCreate()
+    )
+    return lambda: len(spark.read.parquet(path).toPandas())
+
+
+ENGINE_READERS: dict[str, Callable[[str, fsspec.AbstractFileSystem], Callable[[], int]]] = {
+    "pyarrow": read_pyarrow,
+    "duckdb": read_duckdb,
+    "dask": read_dask,
+    "pyspark": read_pyspark,
+}
+
+
+def percentile(timings: list[float], percent: int) -> float:
+    if len(timings) < 2:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method="inclusive")[percent - 1]
+
+
+def run_benchmark(layout: str,
+                  engine: str,
+                  path: str,
+                  warmup: int = WARMUP,
+                  repetitions: int = REPETITIONS) -> BenchmarkResult:
+    """Reads one layout with one engine.
+
+    The peak resident memory is the highest seen during the timed repetitions, including what the
+    process held before, and the bytes read are the median over the timed repetitions. For PySpark
+    the JVM is a child process and is counted with the Python process.
+
+    @param layout: The layout name.
+    @param engine: One of ENGINES.
+    @param path: A Parquet file or a directory of Parquet files, local or gs://.
+    @param warmup: The number of untimed reads first.
+    @param repetitions: The number of timed reads.
+    @return: The result.
+    """
+    read = ENGINE_READERS[engine](path, storage.get_path_file_system(path))
+
+    rows = 0
+    for _ in range(warmup):
+        rows = read()
+
+    timings = []
+    bytes_read = []
+    with PeakRssSampler() as sampler:
+        for _ in range(repetitions):
+            chars_before = read_chars()
+            start_time = time.perf_counter()
+            rows = read()
+            timings.append(time.perf_counter() - start_time)
+            chars_after = read_chars()
+            bytes_read.append(sum(chars - chars_before.get(pid, 0) for pid, chars in chars_after.items()))
+
+    return BenchmarkResult(layout=layout,
+                           engine=engine,
+                           path=path,
+                           rows=rows,
+                           warmup=warmup,
+                           repetitions=repetitions,
+                           median_seconds=statistics.median(timings),
+                           p95_seconds=percentile(timings, 95),
+                           peak_rss_bytes=sampler.peak_rss_bytes,
+                           bytes_read=int(statistics.median(bytes_read)),
+                           timings=timings)
+
+
+def write_results(results: list[BenchmarkResult], results_file: str) -> None:
+    """Appends the results as JSON lines.
+
+    GCS objects can not be appended to, so the file is read and written again whole.
+
+    @param results: The results.
+    @param results_file: A local path or a Google Cloud Storage path.
+    """
+    fs = storage.get_path_file_system(results_file)
+    previous_results = fs.cat_file(results_file).decode() if fs.exists(results_file) else ""
+    with fs.open(results_file, "w") as file:
+        file.write(previous_results)
+        for result in results:
+            file.write(json.dumps(asdict(result)) + "\n")
+
+
+def main(layout_paths: dict[str, str],
+         engines: list[str] = ENGINES,
+         warmup: int = WARMUP,
+         repetitions: int = REPETITIONS,
+         results_file: str = RESULTS_FILE) -> list[BenchmarkResult]:
+    """Reads every layout with every engine, appending each result to the results file as soon as it is measured.
+
+    A failing engine, e.g. one that is not installed, is recorded as a failed result and the others still run.
+    """
+    results = []
+    for engine in engines:
+        for layout, path in layout_paths.items():
+            logging.info("Reading %s with %s from %s", layout, engine, path)
+            try:
+                result = run_benchmark(layout, engine, path, warmup, repetitions)
+            except Exception as error:
+                logging.exception("Failed to read %s with %s", layout, engine)
+                result = BenchmarkResult(layout=layout,
+                                         engine=engine,
+                                         path=path,
+                                         rows=0,
+                                         warmup=warmup,
+                                         repetitions=repetitions,
+                                         median_seconds=None,
+                                         p95_seconds=None,
+                                         peak_rss_bytes=0,
+                                         bytes_read=0,
+                                         error=f"{type(error).__name__}: {error}")
+            else:
+                logging.info("%-11s %-7s %d rows, median %.4f seconds, p95 %.4f seconds, "
+                             "peak RSS %.1f MiB, %.1f MiB read",
+                             layout,
+                             engine,
+                             result.rows,
+                             result.median_seconds,
+                             result.p95_seconds,
+                             result.peak_rss_bytes / 2 ** 20,
+                             result.bytes_read / 2 ** 20)
+            write_results([result], results_file)
+            results.append(result)
+
+    logging.info("Appended %d results, %d failed, to %s",
+                 len(results), sum(result.error is not None for result in results), results_file)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for layout_name in LAYOUTS:
+        parser.add_argument(f"--{layout_name}", help=f"{layout_name} Parquet file or directory, local or gs:// path")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS)
+    parser.add_argument("--results-file", default=RESULTS_FILE, help="JSON lines file the results are appended to")
+    args = parser.parse_args()
+
+    paths = {layout_name: getattr(args, layout_name) for layout_name in LAYOUTS if getattr(args, layout_name)}
+    if not paths:
+        parser.error("at least one of --bredt, --langt and --partitioned is required")
+
+    main(paths, args.engines, args.warmup, args.repetitions, args.results_file)
@@ -0,0 +1,120 @@
+"""
+Benchmark of single-id lookups in unsorted and id-sorted long Parquet files.
+
+Writes two copies of a long section output (e.g. naering or balanseregnskap
+from process_source_data.py) with the same row group size, one as written by
+the pipeline and one sorted by id and felt, and times reading one id from each
+with PyArrow and DuckDB.
+
+    python id_lookup_benchmark.py gs://.../naering-2024-04-18_10-35-24.parquet
+"""
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "1. data collection"))
+import storage  # noqa: E402
+
+# same as LOOKUP_ROW_GROUP_SIZE in process_source_data.py
+ROW_GROUP_SIZE = 64 * 1024
+
+ITERATIONS = 5
+
+
+def count_candidate_row_groups(parquet_path: Path, id_column: str, lookup_id: str) -> int:
+    """Counts the row groups whose min/max statistics may contain the id.
+
+    @param parquet_path: The Parquet file.
+    @param id_column: The identifier column.
+    @param lookup_id: The id to look up.
+    @return: The number of row groups a reader has to scan.
+    """
+    metadata = pq.ParquetFile(parquet_path).metadata
+    column_index = metadata.schema.names.index(id_column)
+    candidates = 0
+    for row_group_index in range(metadata.num_row_groups):
+        statistics_ = metadata.row_group(row_group_index).column(column_index).statistics
+        if statistics_ is None or not statistics_.has_min_max \
+                or statistics_.min <= lookup_id <= statistics_.max:
+            candidates += 1
+    return candidates
+
+
+def time_lookups(lookup, iterations: int) -> tuple[float, int]:
+    """Times a lookup.
+
+    @param lookup: A function returning the number of rows found.
+    @param iterations: The number of timed runs after one warmup run.
+    @return: The median time in seconds and the number of rows found.
+    """
+    num_rows = lookup()
+    timings = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        lookup()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings), num_rows
+
+
+def main(source_path: str,
+         lookup_id: str | None = None,
+         row_group_size: int = ROW_GROUP_SIZE,
+         iterations: int = ITERATIONS) -> None:
+    table = pq.read_table(source_path, filesystem=storage.get_path_file_system(source_path))
+    id_column = "norskIdentifikator" if "norskIdentifikator" in table.column_names else "id"
+    if lookup_id is None:
+        lookup_id = table.column(id_column)[table.num_rows // 2].as_py()
+
+    sorted_table = table.take(pc.sort_indices(table, sort_keys=[(id_column, "ascending"),
+                                                                ("felt", "ascending")]))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        layouts = {
+            "unsorted": Path(temp_dir) / "unsorted.parquet",
+            "sorted": Path(temp_dir) / "sorted.parquet",
+        }
+        pq.write_table(table, layouts["unsorted"], row_group_size=row_group_size)
+        pq.write_table(sorted_table, layouts["sorted"], row_group_size=row_group_size)
+
+        connection = duckdb.connect()
+        logging.info("Looking up %s = %s in %d rows, %d rows per row group",
+                     id_column, lookup_id, table.num_rows, row_group_size)
+
+        for layout, parquet_path in layouts.items():
+            pyarrow_time, num_rows = time_lookups(
+                lambda: pq.read_table(parquet_path, filters=[(id_column, "==", lookup_id)]).num_rows,
+                iterations)
+            duckdb_time, _ = time_lookups(
+                lambda: connection.execute(
+                    f'SELECT COUNT(*) FROM read_parquet(?) WHERE "{id_column}" = ?',
+                    [str(parquet_path), lookup_id]).fetchone()[0],
+                iterations)
+            logging.info("%-8s %d rows found, %d of %d row groups scanned, "
+                         "PyArrow %.4f seconds, DuckDB %.4f seconds",
+                         layout,
+                         num_rows,
+                         count_candidate_row_groups(parquet_path, id_column, lookup_id),
+                         pq.ParquetFile(parquet_path).metadata.num_row_groups,
+                         pyarrow_time,
+                         duckdb_time)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source_path", help="long section output, local or gs:// path")
+    parser.add_argument("--id", dest="lookup_id", help="id to look up, defaults to one from the middle of the file")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    main(args.source_path, args.lookup_id, args.row_group_size, args.iterations)
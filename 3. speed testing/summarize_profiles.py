@@ -0,0 +1,114 @@
+"""
+Ranks the section SQLs by the time DuckDB spent in UNNEST, window (QUALIFY) and projection operators.
+
+Reads the *.profile.json query profiles written next to the outputs by
+process_source_data.py when run with profile=True, sums the operator
+timings of each profile by kind and logs the sections slowest first.
+
+    python summarize_profiles.py gs://ssb-sirius-editering-data-produkt-prod/test
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+from collections.abc import Iterator
+from pathlib import Path, PurePosixPath
+from typing import Any
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "1. data collection"))
+import storage  # noqa: E402
+
+# operator names as in DuckDB's profiles, per kind ranked
+OPERATOR_KINDS = {
+    "unnest": ("UNNEST",),
+    "window": ("WINDOW", "STREAMING_WINDOW"),
+    "projection": ("PROJECTION",),
+}
+
+# table functions in FROM, like UNNEST(...) AS u(x), are INOUT_FUNCTION operators named in extra_info
+TABLE_FUNCTION_OPERATOR = "INOUT_FUNCTION"
+TABLE_FUNCTION_KINDS = {
+    "unnest": "unnest",
+}
+RANK_BY = ["operators", *OPERATOR_KINDS, "total"]
+
+PROFILE_SUFFIX = ".profile.json"
+TIMESTAMP_PATTERN = re.compile(r"-\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$")
+
+
+def iter_operators(node: dict[str, Any]) -> Iterator[tuple[str, float, dict[str, Any]]]:
+    """Walks a profile tree, yielding the name, own time and extra_info of every operator.
+
+    DuckDB 1.1 renamed name and timing to operator_name and operator_timing, both are read.
+    """
+    for child in node.get("children", []):
+        name = child.get("operator_name", child.get("name", ""))
+        timing = child.get("operator_timing", child.get("timing", 0.0))
+        extra_info = child.get("extra_info")
+        yield name.strip(), float(timing), extra_info if isinstance(extra_info, dict) else {}
+        yield from iter_operators(child)
+
+
+def operator_kind(name: str, extra_info: dict[str, Any]) -> str | None:
+    """The kind of OPERATOR_KINDS an operator is ranked as, if any."""
+    if name == TABLE_FUNCTION_OPERATOR:
+        return TABLE_FUNCTION_KINDS.get(str(extra_info.get("Name", "")).strip().lower())
+    for kind, operator_names in OPERATOR_KINDS.items():
+        if name in operator_names:
+            return kind
+    return None
+
+
+def summarize_profile(profile: dict[str, Any]) -> dict[str, float]:
+    """Sums up the operator timings of one query profile.
+
+    @param profile: The JSON profile.
+    @return: The seconds per operator kind, in all ranked operators and in the whole query.
+    """
+    summary = dict.fromkeys(OPERATOR_KINDS, 0.0)
+    for name, timing, extra_info in iter_operators(profile):
+        kind = operator_kind(name, extra_info)
+        if kind is not None:
+            summary[kind] += timing
+
+    summary["operators"] = sum(summary[kind] for kind in OPERATOR_KINDS)
+    summary["total"] = float(profile.get("latency", profile.get("timing", 0.0)))
+    return summary
+
+
+def section_name(profile_filename: str) -> str:
+    """The section of a profile, its filename without the timestamp and suffix."""
+    return TIMESTAMP_PATTERN.sub("", PurePosixPath(profile_filename).name.removesuffix(PROFILE_SUFFIX))
+
+
+def main(profile_dirname: str, rank_by: str = "operators") -> list[tuple[str, dict[str, float]]]:
+    fs = storage.get_path_file_system(profile_dirname)
+    profile_filenames = sorted(fs.glob(f"{profile_dirname.rstrip('/')}/*{PROFILE_SUFFIX}"))
+    if not profile_filenames:
+        logging.warning("No %s files in %s", PROFILE_SUFFIX, profile_dirname)
+        return []
+
+    summaries = []
+    for profile_filename in profile_filenames:
+        with fs.open(profile_filename, mode="r") as profile_file:
+            summaries.append((section_name(profile_filename), summarize_profile(json.load(profile_file))))
+    summaries.sort(key=lambda summary: summary[1][rank_by], reverse=True)
+
+    logging.info("%-40s %10s %10s %10s %10s", "section", "unnest", "window", "projection", "total")
+    for name, summary in summaries:
+        logging.info("%-40s %10.4f %10.4f %10.4f %10.4f",
+                     name, summary["unnest"], summary["window"], summary["projection"], summary["total"])
+    return summaries
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("profile_dirname", help="directory of the profiles, local or gs:// path")
+    parser.add_argument("--rank-by", choices=RANK_BY, default="operators",
+                        help="seconds to rank by, operators is unnest, window and projection together")
+    args = parser.parse_args()
+
+    main(args.profile_dirname, args.rank_by)
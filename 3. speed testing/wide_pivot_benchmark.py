@@ -0,0 +1,110 @@
+"""
+Benchmark of pivoting the long (langt) format to the wide (bredt) format.
+
+Pivots a long section output (e.g. naering from process_source_data.py) to one
+row per id and inntektsaar with a float64 p<type> column per felt, once with
+DuckDB's SUM(...) FILTER aggregation as in WIDE_SQL and once with pandas'
+pivot_table, and compares the Parquet size of the wide table with missing
+values kept as NULL against filled with 0.
+
+    python wide_pivot_benchmark.py gs://.../naering-2024-04-18_10-35-24.parquet
+"""
+import argparse
+import io
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "1. data collection"))
+import storage  # noqa: E402
+
+ITERATIONS = 5
+
+
+def column_name(felt: str) -> str:
+    return felt if not felt.isdigit() else f"p{felt}"
+
+
+def pivot_duckdb(connection: duckdb.DuckDBPyConnection, felts: list[str]) -> pa.Table:
+    columns = ",\n".join(
+        f"CAST(SUM(beloep) FILTER (WHERE felt = '{felt}') AS DOUBLE) AS \"{column_name(felt)}\""
+        for felt in felts
+    )
+    return connection.sql(f"""
+        SELECT id, inntektsaar, {columns}
+        FROM langt
+        GROUP BY id, inntektsaar
+        ORDER BY id, inntektsaar
+    """).fetch_arrow_table()
+
+
+def pivot_pandas(langt_df: pd.DataFrame, felts: list[str]) -> pd.DataFrame:
+    bredt_df = langt_df.pivot_table(index=["id", "inntektsaar"], columns="felt", values="beloep", aggfunc="sum")
+    bredt_df = bredt_df.reindex(columns=felts).astype("float64")
+    bredt_df.columns = [column_name(felt) for felt in felts]
+    return bredt_df.reset_index()
+
+
+def time_pivot(pivot, iterations: int) -> float:
+    """Times a pivot.
+
+    @param pivot: A function doing the pivot.
+    @param iterations: The number of timed runs after one warmup run.
+    @return: The median time in seconds.
+    """
+    pivot()
+    timings = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        pivot()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+
+def parquet_size(table: pa.Table) -> int:
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getbuffer().nbytes
+
+
+def main(source_path: str, iterations: int = ITERATIONS) -> None:
+    langt_table = pq.read_table(source_path,
+                                filesystem=storage.get_path_file_system(source_path),
+                                columns=["id", "inntektsaar", "felt", "beloep"])
+    felts = sorted(set(langt_table.column("felt").to_pylist()))
+
+    connection = duckdb.connect()
+    connection.register("langt", langt_table)
+    langt_df = langt_table.to_pandas()
+
+    # pandas is timed from a DataFrame, leaving out the Arrow to pandas conversion
+    duckdb_time = time_pivot(lambda: pivot_duckdb(connection, felts), iterations)
+    pandas_time = time_pivot(lambda: pivot_pandas(langt_df, felts), iterations)
+
+    bredt_table = pivot_duckdb(connection, felts)
+    bredt_filled_table = pa.Table.from_pandas(bredt_table.to_pandas().fillna(0.0), preserve_index=False)
+
+    logging.info("Pivoted %d long rows to %d rows and %d columns",
+                 langt_table.num_rows, bredt_table.num_rows, bredt_table.num_columns)
+    logging.info("DuckDB SUM FILTER %.4f seconds, pandas pivot_table %.4f seconds (%.1fx)",
+                 duckdb_time, pandas_time, pandas_time / duckdb_time)
+    logging.info("Parquet size with NULL for missing values %d bytes, filled with 0 %d bytes",
+                 parquet_size(bredt_table), parquet_size(bredt_filled_table))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source_path", help="long section output, local or gs:// path")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    main(args.source_path, args.iterations)